@@ -81,7 +81,7 @@ from .func import (
     plot_hist
 )
 
-from .hammer import HammerAitoffPlot
+from .hammer import HammerAitoffPlot, SkyDensity
 
 # aliases
 Arc = DataArc
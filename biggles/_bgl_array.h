@@ -0,0 +1,82 @@
+/*
+ * Copyright (C) 2001 Mike Nolta <mike@nolta.net>
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public License
+ * as published by the Free Software Foundation; either version 2
+ * of the License, or (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public
+ * License along with this program; if not, write to the
+ * Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+ * Boston, MA  02111-1307, USA.
+ *
+ */
+
+/*
+ *  Array access shared by _biggles and _libplot_pywrap. Include it after
+ *  Python.h and numpy/arrayobject.h.
+ */
+
+#ifndef BGL_ARRAY_H
+#define BGL_ARRAY_H
+
+/*
+ *  Input arrays of float64 or float32 are read in place, whatever their
+ *  strides, so views and memory maps aren't copied; anything else is
+ *  converted to a float64 array. BGL_Array1 and BGL_Array2 read an
+ *  element of either as a double.
+ */
+
+#define BGL_Array1(v,i)\
+	(PyArray_TYPE((PyArrayObject *)(v)) == NPY_FLOAT\
+		? (double) *(float *)PyArray_GETPTR1((PyArrayObject *)(v),i)\
+		: *(double *)PyArray_GETPTR1((PyArrayObject *)(v),i))
+
+#define BGL_Array2(v,i,j)\
+	(PyArray_TYPE((PyArrayObject *)(v)) == NPY_FLOAT\
+		? (double) *(float *)PyArray_GETPTR2((PyArrayObject *)(v),i,j)\
+		: *(double *)PyArray_GETPTR2((PyArrayObject *)(v),i,j))
+
+/*
+ *  Output arrays are always new contiguous float64 arrays.
+ *  BGL_DArray1_ptr points at an element of one, to write it or to hand
+ *  the rest of the array to code filling it in.
+ */
+
+#define BGL_DArray1_ptr(v,i)\
+	((double *)PyArray_GETPTR1((PyArrayObject *)(v),i))
+
+/* whether o is an nd-array whose elements can be read in place */
+static int
+_bgl_in_place( PyObject *o, int nd )
+{
+	PyArrayObject *a = (PyArrayObject *) o;
+
+	return PyArray_Check(o) && PyArray_NDIM(a) == nd
+		&& PyArray_ISALIGNED(a) && PyArray_ISNOTSWAPPED(a);
+}
+
+static PyObject *
+_bgl_array( PyObject *o, int nd )
+{
+	int type;
+
+	if ( _bgl_in_place(o, nd) )
+	{
+		type = PyArray_TYPE((PyArrayObject *)o);
+		if ( type == NPY_DOUBLE || type == NPY_FLOAT )
+		{
+			Py_INCREF(o);
+			return o;
+		}
+	}
+	return PyArray_ContiguousFromAny( o, NPY_DOUBLE, nd, nd );
+}
+
+#endif /* BGL_ARRAY_H */
@@ -28,15 +28,11 @@
 #define M_PI 3.14159265358979323846
 #endif
 
-#define BGL_DArray1(v,i)\
-	(*(double *)PyArray_GETPTR1((PyObject*)(v),i))
-
-#define BGL_DArray1_ptr(v,i)\
-	((double *)PyArray_GETPTR1((PyObject*)(v),i))
-
-#define BGL_DArray2(v,i,j)\
-	(*(double *)PyArray_GETPTR2((PyObject*)(v),i,j))
+#ifndef M_SQRT2
+#define M_SQRT2 1.41421356237309504880
+#endif
 
+#include "_bgl_array.h"
 
 /*
  *  I wish min/max(z) worked.
@@ -45,6 +41,22 @@
 #define BGL_MIN(a,b) (((a) < (b)) ? (a) : (b))
 #define BGL_MAX(a,b) (((a) > (b)) ? (a) : (b))
 
+/*
+ *  Scratch memory for the loops run with the GIL released, where
+ *  PyMem_Malloc can't be called on Python 3. Running out of it is
+ *  reported with PyErr_NoMemory once the GIL is held again.
+ */
+
+#if PY_VERSION_HEX >= 0x03040000
+#define BGL_New(type,n)		((type *) PyMem_RawMalloc((n)*sizeof(type)))
+#define BGL_Realloc(p,n)	PyMem_RawRealloc(p,n)
+#define BGL_Free(p)		PyMem_RawFree(p)
+#else
+#define BGL_New(type,n)		PyMem_New(type,n)
+#define BGL_Realloc(p,n)	PyMem_Realloc(p,n)
+#define BGL_Free(p)		PyMem_Free(p)
+#endif
+
 /******************************************************************************
  *  contour.py
  *
@@ -105,12 +117,64 @@ _find_zero( double p[3], double q[3], double zero[2] )
 	return 0;
 }
 
+/*
+ *  Names the zero _find_zero(p[a], p[b]) finds in cell (i,j) by where
+ *  it lies on the grid: a grid point, a grid edge, a cell centre or a
+ *  cell diagonal. Neighbouring cells give a zero on their shared edge
+ *  the same id, whichever direction they interpolated it from.
+ */
+static npy_int64
+_zero_id( double p[5][3], int a, int b, npy_intp i, npy_intp j, npy_intp ny )
+{
+	npy_intp ii = i, jj = j;
+	int kind;
+
+	if ( p[a][2] == 0. && a == 4 )
+		kind = 3;
+	else if ( p[a][2] == 0. )
+	{
+		ii = i + (a/2 % 2);
+		jj = j + ((a+1)/2 % 2);
+		kind = 0;
+	}
+	else if ( a == 4 || b == 4 )
+		kind = 4 + (a == 4 ? b : a);
+	else
+	{
+		/* edges 0-1 and 2-3 run along y, 1-2 and 3-0 along x */
+		ii = i + (a == 2);
+		jj = j + (a == 1);
+		kind = (a % 2 == 0) ? 2 : 1;
+	}
+
+	return ((npy_int64) ii*ny + jj)*8 + kind;
+}
+
+static void
+_pixel_corners( PyObject *x, PyObject *y, PyObject *z,
+	int i, int j, double c[4][3] )
+{
+	int k, ii, jj;
+
+	for ( k = 0; k < 4; k++ )
+	{
+		ii = i + (k/2 % 2);
+		jj = j + ((k+1)/2 % 2);
+
+		c[k][0] = BGL_Array1(x,ii);
+		c[k][1] = BGL_Array1(y,jj);
+		c[k][2] = BGL_Array2(z,ii,jj);
+	}
+}
+
+/* the segments of level z0 in the cell with corners c */
 static int
-_pixel_interpolate( PyObject *x, PyObject *y, PyObject *z,
-	double z0, int i, int j, double segs[BGL_MAX_SEGS][4] )
+_pixel_level( double c[4][3], double z0, npy_intp i, npy_intp j, npy_intp ny,
+	double segs[BGL_MAX_SEGS][4], npy_int64 ids[BGL_MAX_SEGS][2] )
 {
-	int k, l, ii, jj, kk;
+	int k, l, kk;
 	double p[5][3], zeros[3][2];
+	npy_int64 zids[3];
 	int nz, ns;
 
 	for ( l = 0; l < 3; l++ )
@@ -118,12 +182,9 @@ _pixel_interpolate( PyObject *x, PyObject *y, PyObject *z,
 
 	for ( k = 0; k < 4; k++ )
 	{
-		ii = i + (k/2 % 2);
-		jj = j + ((k+1)/2 % 2);
-
-		p[k][0] = BGL_DArray1(x,ii);
-		p[k][1] = BGL_DArray1(y,jj);
-		p[k][2] = BGL_DArray2(z,ii,jj) - z0;
+		p[k][0] = c[k][0];
+		p[k][1] = c[k][1];
+		p[k][2] = c[k][2] - z0;
 
 		for ( l = 0; l < 3; l++ )
 			p[4][l] += 0.25 * p[k][l];
@@ -136,9 +197,12 @@ _pixel_interpolate( PyObject *x, PyObject *y, PyObject *z,
 		kk = (k + 1) % 4;
 
 		nz = 0;
-		nz += _find_zero( p[4], p[k], zeros[nz] );
-		nz += _find_zero( p[k], p[kk], zeros[nz] );
-		nz += _find_zero( p[kk], p[4], zeros[nz] );
+		if ( _find_zero( p[4], p[k], zeros[nz] ) )
+			zids[nz++] = ids ? _zero_id( p, 4, k, i, j, ny ) : 0;
+		if ( _find_zero( p[k], p[kk], zeros[nz] ) )
+			zids[nz++] = ids ? _zero_id( p, k, kk, i, j, ny ) : 0;
+		if ( _find_zero( p[kk], p[4], zeros[nz] ) )
+			zids[nz++] = ids ? _zero_id( p, kk, 4, i, j, ny ) : 0;
 
 		if ( nz == 2 )
 		{
@@ -146,6 +210,11 @@ _pixel_interpolate( PyObject *x, PyObject *y, PyObject *z,
 			segs[ns][1] = zeros[0][1];
 			segs[ns][2] = zeros[1][0];
 			segs[ns][3] = zeros[1][1];
+			if ( ids )
+			{
+				ids[ns][0] = zids[0];
+				ids[ns][1] = zids[1];
+			}
 			ns++;
 		}
 	}
@@ -153,6 +222,17 @@ _pixel_interpolate( PyObject *x, PyObject *y, PyObject *z,
 	return ns;
 }
 
+static int
+_pixel_interpolate( PyObject *x, PyObject *y, PyObject *z,
+	double z0, int i, int j, double segs[BGL_MAX_SEGS][4],
+	npy_int64 ids[BGL_MAX_SEGS][2] )
+{
+	double c[4][3];
+
+	_pixel_corners( x, y, z, i, j, c );
+	return _pixel_level( c, z0, i, j, PyArray_DIM(z,1), segs, ids );
+}
+
 static PyObject *
 biggles_contour_segments( PyObject *self, PyObject *args )
 {
@@ -167,9 +247,9 @@ biggles_contour_segments( PyObject *self, PyObject *args )
 	if ( !PyArg_ParseTuple(args, "OOOd", &ox, &oy, &oz, &z0) )
 		return NULL;
 
-	x = PyArray_ContiguousFromAny( ox, NPY_DOUBLE, 1, 1 );
-	y = PyArray_ContiguousFromAny( oy, NPY_DOUBLE, 1, 1 );
-	z = PyArray_ContiguousFromAny( oz, NPY_DOUBLE, 2, 2 );
+	x = _bgl_array( ox, 1 );
+	y = _bgl_array( oy, 1 );
+	z = _bgl_array( oz, 2 );
 
 	if ( x == NULL || y == NULL || z == NULL )
 		goto quit;
@@ -188,7 +268,7 @@ biggles_contour_segments( PyObject *self, PyObject *args )
 	for ( i = 0; i < PyArray_DIM(z,0)-1; i++ )
         for ( j = 0; j < PyArray_DIM(z,1)-1; j++ )
         {
-            ns = _pixel_interpolate( x, y, z, z0, i, j, segs );
+            ns = _pixel_interpolate( x, y, z, z0, i, j, segs, NULL );
             for ( k = 0; k < ns; k++ )
             {
                 ref = Py_BuildValue( "((dd)(dd))",
@@ -206,6 +286,732 @@ quit:
 	return list;
 }
 
+/*
+ *  Joining the segments into polylines.
+ *
+ *  The segments are joined greedily, in the order they come out of
+ *  the grid scan: each one starts a new line, extends a line, joins
+ *  two lines or closes a line, depending on which open line ends it
+ *  touches. Line ends are looked up in a hash of their position on
+ *  the grid (see _zero_id), not of their coordinates: the two cells
+ *  either side of an edge interpolate its zero from opposite ends and
+ *  can disagree in the last bit, which used to break lines apart.
+ *
+ *  Each line is a chain of nodes. A node keeps its two neighbours
+ *  rather than a direction, so a line can be reversed by swapping
+ *  its two ends.
+ */
+
+typedef struct {
+	double *px, *py;		/* node coordinates */
+	npy_int64 *id;			/* node position on the grid */
+	npy_intp *nb;			/* two neighbours per node, -1 for none */
+	npy_intp nnodes;
+
+	npy_intp *ends;			/* first and last node of each line */
+	char *state;			/* 0 joined into another line, 1 open, 2 closed */
+	npy_intp nlines;
+	npy_intp *closed;		/* closed lines, in the order they closed */
+	npy_intp nclosed;
+
+	npy_intp *bucket;		/* hash of open line ends; entry 2*line+end */
+	npy_intp *next;
+	npy_uint64 mask;
+
+	npy_intp nbad;			/* segments touching more than two ends */
+} BGL_Stitch;
+
+static npy_uint64
+_id_hash( npy_int64 id )
+{
+	npy_uint64 a = (npy_uint64) id;
+
+	a ^= a >> 31;
+	a *= 0x9e3779b97f4a7c15ULL;
+	a ^= a >> 31;
+	a *= 0xbf58476d1ce4e5b9ULL;
+	a ^= a >> 29;
+	return a;
+}
+
+static int
+_stitch_init( BGL_Stitch *s, npy_intp nsegs )
+{
+	npy_intp i, nbuckets = 16;
+
+	while ( nbuckets < 2*nsegs )
+		nbuckets *= 2;
+
+	memset( s, 0, sizeof(*s) );
+	s->px = BGL_New( double, 2*nsegs );
+	s->py = BGL_New( double, 2*nsegs );
+	s->id = BGL_New( npy_int64, 2*nsegs );
+	s->nb = BGL_New( npy_intp, 4*nsegs );
+	s->ends = BGL_New( npy_intp, 2*nsegs );
+	s->state = BGL_New( char, nsegs );
+	s->closed = BGL_New( npy_intp, nsegs );
+	s->bucket = BGL_New( npy_intp, nbuckets );
+	s->next = BGL_New( npy_intp, 2*nsegs );
+	s->mask = nbuckets - 1;
+
+	if ( s->px == NULL || s->py == NULL || s->id == NULL || s->nb == NULL
+			|| s->ends == NULL || s->state == NULL || s->closed == NULL
+			|| s->bucket == NULL || s->next == NULL )
+		return -1;
+
+	for ( i = 0; i < nbuckets; i++ )
+		s->bucket[i] = -1;
+	return 0;
+}
+
+static void
+_stitch_free( BGL_Stitch *s )
+{
+	BGL_Free( s->px );
+	BGL_Free( s->py );
+	BGL_Free( s->id );
+	BGL_Free( s->nb );
+	BGL_Free( s->ends );
+	BGL_Free( s->state );
+	BGL_Free( s->closed );
+	BGL_Free( s->bucket );
+	BGL_Free( s->next );
+	memset( s, 0, sizeof(*s) );
+}
+
+static npy_intp
+_stitch_node( BGL_Stitch *s, double x, double y, npy_int64 id )
+{
+	npy_intp k = s->nnodes++;
+
+	s->px[k] = x;
+	s->py[k] = y;
+	s->id[k] = id;
+	s->nb[2*k] = -1;
+	s->nb[2*k+1] = -1;
+	return k;
+}
+
+static void
+_stitch_link( BGL_Stitch *s, npy_intp a, npy_intp b )
+{
+	s->nb[2*a + (s->nb[2*a] >= 0)] = b;
+	s->nb[2*b + (s->nb[2*b] >= 0)] = a;
+}
+
+static npy_intp *
+_stitch_slot( BGL_Stitch *s, npy_intp e )
+{
+	npy_intp k = s->ends[e];
+	return s->bucket + (_id_hash(s->id[k]) & s->mask);
+}
+
+static void
+_stitch_hash_add( BGL_Stitch *s, npy_intp e )
+{
+	npy_intp *slot = _stitch_slot( s, e );
+
+	s->next[e] = *slot;
+	*slot = e;
+}
+
+static void
+_stitch_hash_remove( BGL_Stitch *s, npy_intp e )
+{
+	npy_intp *slot = _stitch_slot( s, e );
+
+	while ( *slot != e )
+		slot = s->next + *slot;
+	*slot = s->next[e];
+}
+
+static npy_intp
+_stitch_new_line( BGL_Stitch *s, npy_intp first, npy_intp last )
+{
+	npy_intp l = s->nlines++;
+
+	s->ends[2*l] = first;
+	s->ends[2*l+1] = last;
+	s->state[l] = 1;
+	_stitch_hash_add( s, 2*l );
+	_stitch_hash_add( s, 2*l+1 );
+	return l;
+}
+
+static void
+_stitch_end_line( BGL_Stitch *s, npy_intp l, char state )
+{
+	_stitch_hash_remove( s, 2*l );
+	_stitch_hash_remove( s, 2*l+1 );
+	s->state[l] = state;
+}
+
+#define BGL_NODE_IS(s,k,nid) ((s)->id[k] == (nid))
+
+/* up to 4 open lines with an end at grid position id, in line order */
+static int
+_stitch_find( BGL_Stitch *s, npy_int64 id, npy_intp lines[4], int n )
+{
+	npy_intp e, l;
+	int i, j;
+
+	e = s->bucket[_id_hash(id) & s->mask];
+	for ( ; e >= 0; e = s->next[e] )
+	{
+		if ( !BGL_NODE_IS(s, s->ends[e], id) )
+			continue;
+		l = e/2;
+		for ( i = 0; i < n && lines[i] < l; i++ )
+			;
+		if ( i < n && lines[i] == l )
+			continue;
+		if ( n == 4 )
+			return n;
+		for ( j = n; j > i; j-- )
+			lines[j] = lines[j-1];
+		lines[i] = l;
+		n++;
+	}
+	return n;
+}
+
+static void
+_stitch_segment( BGL_Stitch *s, double ax, double ay, npy_int64 a,
+	double bx, double by, npy_int64 b )
+{
+	npy_intp lines[4], hit_line[4], k0, k1, l, m;
+	int hit_end[4], nlines, nhits, i;
+
+	nlines = _stitch_find( s, a, lines, 0 );
+	nlines = _stitch_find( s, b, lines, nlines );
+	if ( nlines > 2 )
+	{
+		s->nbad++;
+		return;
+	}
+
+	/* which ends of which lines the segment touches, a before b */
+	nhits = 0;
+	for ( i = 0; i < nlines; i++ )
+	{
+		k0 = s->ends[2*lines[i]];
+		k1 = s->ends[2*lines[i]+1];
+		if ( BGL_NODE_IS(s, k0, a) || BGL_NODE_IS(s, k1, a) )
+		{
+			hit_line[nhits] = lines[i];
+			hit_end[nhits++] = !BGL_NODE_IS(s, k0, a);
+		}
+		if ( BGL_NODE_IS(s, k0, b) || BGL_NODE_IS(s, k1, b) )
+		{
+			hit_line[nhits] = lines[i];
+			hit_end[nhits++] = !BGL_NODE_IS(s, k0, b);
+		}
+	}
+
+	if ( nhits == 0 )
+	{
+		k0 = _stitch_node( s, ax, ay, a );
+		k1 = _stitch_node( s, bx, by, b );
+		_stitch_link( s, k0, k1 );
+		_stitch_new_line( s, k0, k1 );
+	}
+	else if ( nhits == 1 )
+	{
+		/* grow the touched end by the other end of the segment */
+		m = 2*hit_line[0] + hit_end[0];
+		if ( BGL_NODE_IS(s, s->ends[m], a) )
+			k1 = _stitch_node( s, bx, by, b );
+		else
+			k1 = _stitch_node( s, ax, ay, a );
+		_stitch_hash_remove( s, m );
+		_stitch_link( s, s->ends[m], k1 );
+		s->ends[m] = k1;
+		_stitch_hash_add( s, m );
+	}
+	else if ( nhits == 2 && hit_line[0] == hit_line[1] )
+	{
+		l = hit_line[0];
+		_stitch_end_line( s, l, 2 );
+		s->closed[s->nclosed++] = l;
+	}
+	else if ( nhits == 2 )
+	{
+		/* the touched ends become the inside of the joined line */
+		k0 = s->ends[2*hit_line[0] + hit_end[0]];
+		k1 = s->ends[2*hit_line[1] + hit_end[1]];
+		_stitch_link( s, k0, k1 );
+		_stitch_end_line( s, hit_line[0], 0 );
+		_stitch_end_line( s, hit_line[1], 0 );
+		l = hit_line[0];
+		m = hit_line[1];
+		if ( hit_end[0] == 1 && hit_end[1] == 0 )
+			_stitch_new_line( s, s->ends[2*l], s->ends[2*m+1] );
+		else if ( hit_end[0] == 0 && hit_end[1] == 1 )
+			_stitch_new_line( s, s->ends[2*m], s->ends[2*l+1] );
+		else if ( hit_end[0] == 0 )
+			/* reversed l0, then l1 */
+			_stitch_new_line( s, s->ends[2*l+1], s->ends[2*m+1] );
+		else
+			/* l0, then reversed l1 */
+			_stitch_new_line( s, s->ends[2*l], s->ends[2*m] );
+	}
+	else
+		s->nbad++;
+}
+
+/*
+ *  The lines come out open lines first, oldest first, then the closed
+ *  lines in the order they were closed. Returns the line at position
+ *  i of that order, or -1 for a line that was joined into another.
+ */
+static npy_intp
+_stitch_nth_line( BGL_Stitch *s, npy_intp i )
+{
+	if ( i >= s->nlines )
+		return s->closed[i - s->nlines];
+	return s->state[i] == 1 ? i : -1;
+}
+
+/* copies the points of line l to px, py unless NULL; returns their number */
+static npy_intp
+_stitch_line_copy( BGL_Stitch *s, npy_intp l, double *px, double *py )
+{
+	npy_intp k, prev, next, n;
+
+	n = 0;
+	prev = -1;
+	for ( k = s->ends[2*l]; k >= 0; prev = k, k = next )
+	{
+		next = s->nb[2*k] != prev ? s->nb[2*k] : s->nb[2*k+1];
+		if ( px != NULL )
+		{
+			px[n] = s->px[k];
+			py[n] = s->py[k];
+		}
+		n++;
+	}
+	if ( s->state[l] == 2 )
+	{
+		if ( px != NULL )
+		{
+			px[n] = px[0];
+			py[n] = py[0];
+		}
+		n++;
+	}
+	return n;
+}
+
+static PyObject *
+_stitch_line( BGL_Stitch *s, npy_intp l )
+{
+	PyObject *ox, *oy, *ret;
+	npy_intp n;
+
+	n = _stitch_line_copy( s, l, NULL, NULL );
+
+	ret = NULL;
+	ox = PyArray_SimpleNew( 1, &n, NPY_DOUBLE );
+	oy = PyArray_SimpleNew( 1, &n, NPY_DOUBLE );
+	if ( ox == NULL || oy == NULL )
+		goto quit;
+
+	_stitch_line_copy( s, l, BGL_DArray1_ptr(ox,0), BGL_DArray1_ptr(oy,0) );
+	ret = Py_BuildValue( "OO", ox, oy );
+quit:
+	Py_XDECREF(ox);
+	Py_XDECREF(oy);
+	return ret;
+}
+
+/* the lines as (x, y) array pairs */
+static PyObject *
+_stitch_lines( BGL_Stitch *s )
+{
+	PyObject *list, *line;
+	npy_intp i, l;
+
+	list = PyList_New( 0 );
+	if ( list == NULL )
+		return NULL;
+
+	for ( i = 0; i < s->nlines + s->nclosed; i++ )
+	{
+		l = _stitch_nth_line( s, i );
+		if ( l < 0 )
+			continue;
+
+		line = _stitch_line( s, l );
+		if ( line == NULL || PyList_Append(list, line) < 0 )
+		{
+			Py_XDECREF(line);
+			Py_DECREF(list);
+			return NULL;
+		}
+		Py_DECREF(line);
+	}
+
+	return list;
+}
+
+/* a growing list of segments, and the grid positions of their ends */
+typedef struct {
+	double *xy;
+	npy_int64 *ids;
+	npy_intp n, cap;
+} BGL_Segs;
+
+static int
+_segs_add( BGL_Segs *b, double seg[BGL_MAX_SEGS][4],
+	npy_int64 ids[BGL_MAX_SEGS][2], int ns )
+{
+	double *tmp;
+	npy_int64 *itmp;
+	int k;
+
+	if ( b->n + ns > b->cap )
+	{
+		b->cap = 2*b->cap + 4*BGL_MAX_SEGS;
+		tmp = BGL_Realloc( b->xy, 4*b->cap*sizeof(double) );
+		if ( tmp != NULL )
+			b->xy = tmp;
+		itmp = BGL_Realloc( b->ids, 2*b->cap*sizeof(npy_int64) );
+		if ( itmp != NULL )
+			b->ids = itmp;
+		if ( tmp == NULL || itmp == NULL )
+			return -1;
+	}
+
+	for ( k = 0; k < ns; k++, b->n++ )
+	{
+		memcpy( b->xy + 4*b->n, seg[k], sizeof(seg[k]) );
+		memcpy( b->ids + 2*b->n, ids[k], sizeof(ids[k]) );
+	}
+	return 0;
+}
+
+static void
+_segs_free( BGL_Segs *b )
+{
+	BGL_Free( b->xy );
+	BGL_Free( b->ids );
+	memset( b, 0, sizeof(*b) );
+}
+
+static int
+_stitch_segs( BGL_Stitch *s, BGL_Segs *b )
+{
+	npy_intp i;
+	double *xy = b->xy;
+	npy_int64 *ids = b->ids;
+
+	if ( _stitch_init(s, b->n) < 0 )
+		return -1;
+
+	for ( i = 0; i < b->n; i++ )
+		_stitch_segment( s, xy[4*i], xy[4*i+1], ids[2*i],
+			xy[4*i+2], xy[4*i+3], ids[2*i+1] );
+	return 0;
+}
+
+static int
+_contour_arrays( PyObject *ox, PyObject *oy, PyObject *oz,
+	PyObject **x, PyObject **y, PyObject **z )
+{
+	*x = _bgl_array( ox, 1 );
+	*y = _bgl_array( oy, 1 );
+	*z = _bgl_array( oz, 2 );
+
+	if ( *x == NULL || *y == NULL || *z == NULL )
+		return -1;
+
+	if ( PyArray_DIM(*z,0) != PyArray_DIM(*x,0)
+			|| PyArray_DIM(*z,1) != PyArray_DIM(*y,0) )
+	{
+		PyErr_SetString( PyExc_ValueError,
+			"array dimensions are not compatible" );
+		return -1;
+	}
+	return 0;
+}
+
+/* the segments of level z0 in every cell of the grid */
+static int
+_grid_segs( PyObject *x, PyObject *y, PyObject *z, double z0,
+	BGL_Segs *segs )
+{
+	double seg[BGL_MAX_SEGS][4];
+	npy_int64 seg_ids[BGL_MAX_SEGS][2];
+	npy_intp i, j, nx, ny;
+	int ns;
+
+	nx = PyArray_DIM(z,0);
+	ny = PyArray_DIM(z,1);
+	for ( i = 0; i < nx-1; i++ )
+		for ( j = 0; j < ny-1; j++ )
+		{
+			ns = _pixel_interpolate( x, y, z, z0, i, j, seg, seg_ids );
+			if ( _segs_add(segs, seg, seg_ids, ns) < 0 )
+				return -1;
+		}
+	return 0;
+}
+
+static PyObject *
+biggles_contour_lines( PyObject *self, PyObject *args )
+{
+	PyObject *ox, *oy, *oz, *lines, *ret;
+	PyObject *x, *y, *z;
+	double z0;
+	BGL_Segs segs;
+	BGL_Stitch s;
+	int err;
+
+	ret = NULL;
+	x = y = z = NULL;
+	memset( &segs, 0, sizeof(segs) );
+	memset( &s, 0, sizeof(s) );
+
+	if ( !PyArg_ParseTuple(args, "OOOd", &ox, &oy, &oz, &z0) )
+		return NULL;
+	if ( _contour_arrays(ox, oy, oz, &x, &y, &z) < 0 )
+		goto quit;
+
+	Py_BEGIN_ALLOW_THREADS
+	err = _grid_segs( x, y, z, z0, &segs ) < 0
+		|| _stitch_segs( &s, &segs ) < 0;
+	Py_END_ALLOW_THREADS
+
+	if ( err )
+	{
+		PyErr_NoMemory();
+		goto quit;
+	}
+
+	lines = _stitch_lines( &s );
+	if ( lines == NULL )
+		goto quit;
+
+	ret = Py_BuildValue( "Nn", lines, s.nbad );
+
+quit:
+	_stitch_free( &s );
+	_segs_free( &segs );
+	Py_XDECREF(x);
+	Py_XDECREF(y);
+	Py_XDECREF(z);
+	return ret;
+}
+
+/*
+ *  The stitched lines of every level, in s; each cell of the grid is
+ *  only visited for the levels between its lowest and highest corners.
+ */
+static int
+_grid_levels( PyObject *x, PyObject *y, PyObject *z,
+	double *lv, npy_intp nlevels, npy_intp *order, double *sorted,
+	BGL_Segs *segs, BGL_Stitch *s )
+{
+	double c[4][3], seg[BGL_MAX_SEGS][4], zmin, zmax, t;
+	npy_int64 seg_ids[BGL_MAX_SEGS][2];
+	npy_intp i, j, k, m, nx, ny, nsorted, lo, hi;
+	int ns;
+
+	nx = PyArray_DIM(z,0);
+	ny = PyArray_DIM(z,1);
+
+	/* insertion sort; NaN levels never cross anything */
+	nsorted = 0;
+	for ( m = 0; m < nlevels; m++ )
+	{
+		if ( lv[m] != lv[m] )
+			continue;
+		for ( k = nsorted; k > 0 && sorted[k-1] > lv[m]; k-- )
+		{
+			sorted[k] = sorted[k-1];
+			order[k] = order[k-1];
+		}
+		sorted[k] = lv[m];
+		order[k] = m;
+		nsorted++;
+	}
+
+	for ( i = 0; i < nx-1; i++ )
+		for ( j = 0; j < ny-1; j++ )
+		{
+			_pixel_corners( x, y, z, i, j, c );
+
+			/* NaN corners never cross, and the range skips them */
+			zmin = HUGE_VAL;
+			zmax = -HUGE_VAL;
+			for ( k = 0; k < 4; k++ )
+			{
+				t = c[k][2];
+				if ( t < zmin )
+					zmin = t;
+				if ( t > zmax )
+					zmax = t;
+			}
+
+			/* first level >= zmin */
+			lo = 0;
+			hi = nsorted;
+			while ( lo < hi )
+			{
+				k = (lo + hi)/2;
+				if ( sorted[k] < zmin )
+					lo = k + 1;
+				else
+					hi = k;
+			}
+
+			for ( k = lo; k < nsorted && sorted[k] <= zmax; k++ )
+			{
+				m = order[k];
+				ns = _pixel_level( c, lv[m], i, j, ny, seg, seg_ids );
+				if ( _segs_add(&segs[m], seg, seg_ids, ns) < 0 )
+					return -1;
+			}
+		}
+
+	for ( m = 0; m < nlevels; m++ )
+	{
+		if ( _stitch_segs(&s[m], &segs[m]) < 0 )
+			return -1;
+		_segs_free( &segs[m] );
+	}
+	return 0;
+}
+
+/*
+ *  Contours every level in one scan of the grid (see _grid_levels).
+ *
+ *  Returns (x, y, line_start, level_start, nbad): the points of all
+ *  the lines end to end, line n being x[line_start[n]:line_start[n+1]],
+ *  and the lines of level m being lines level_start[m] up to
+ *  level_start[m+1], in the order contour_lines gives them.
+ */
+static PyObject *
+biggles_contour_levels( PyObject *self, PyObject *args )
+{
+	PyObject *ox, *oy, *oz, *olevels, *ret;
+	PyObject *xs, *ys, *oline, *olevel;
+	PyObject *x, *y, *z, *levels;
+	double *lv, *sorted;
+	npy_intp i, k, m, n, nlevels;
+	npy_intp *order, npts, nout, nbad, *line_start, *level_start;
+	BGL_Segs *segs;
+	BGL_Stitch *s;
+	int err;
+
+	ret = NULL;
+	x = y = z = levels = NULL;
+	xs = ys = oline = olevel = NULL;
+	order = NULL;
+	sorted = NULL;
+	segs = NULL;
+	s = NULL;
+	nlevels = 0;
+
+	if ( !PyArg_ParseTuple(args, "OOOO", &ox, &oy, &oz, &olevels) )
+		return NULL;
+	if ( _contour_arrays(ox, oy, oz, &x, &y, &z) < 0 )
+		goto quit;
+	levels = PyArray_ContiguousFromAny( olevels, NPY_DOUBLE, 1, 1 );
+	if ( levels == NULL )
+		goto quit;
+
+	nlevels = PyArray_SIZE(levels);
+	lv = (double *) PyArray_DATA(levels);
+
+	order = BGL_New( npy_intp, nlevels + 1 );
+	sorted = BGL_New( double, nlevels + 1 );
+	segs = BGL_New( BGL_Segs, nlevels + 1 );
+	s = BGL_New( BGL_Stitch, nlevels + 1 );
+	if ( order == NULL || sorted == NULL || segs == NULL || s == NULL )
+	{
+		PyErr_NoMemory();
+		goto quit;
+	}
+	memset( segs, 0, (nlevels + 1)*sizeof(BGL_Segs) );
+	memset( s, 0, (nlevels + 1)*sizeof(BGL_Stitch) );
+
+	Py_BEGIN_ALLOW_THREADS
+	err = _grid_levels( x, y, z, lv, nlevels, order, sorted, segs, s );
+	Py_END_ALLOW_THREADS
+
+	if ( err < 0 )
+	{
+		PyErr_NoMemory();
+		goto quit;
+	}
+
+	npts = 0;
+	nout = 0;
+	nbad = 0;
+	for ( m = 0; m < nlevels; m++ )
+	{
+		npts += s[m].nnodes + s[m].nclosed;
+		for ( i = 0; i < s[m].nlines + s[m].nclosed; i++ )
+			nout += _stitch_nth_line( &s[m], i ) >= 0;
+		nbad += s[m].nbad;
+	}
+
+	n = nout + 1;
+	xs = PyArray_SimpleNew( 1, &npts, NPY_DOUBLE );
+	ys = PyArray_SimpleNew( 1, &npts, NPY_DOUBLE );
+	oline = PyArray_SimpleNew( 1, &n, NPY_INTP );
+	n = nlevels + 1;
+	olevel = PyArray_SimpleNew( 1, &n, NPY_INTP );
+	if ( xs == NULL || ys == NULL || oline == NULL || olevel == NULL )
+		goto quit;
+
+	Py_BEGIN_ALLOW_THREADS
+	line_start = (npy_intp *) PyArray_DATA(oline);
+	level_start = (npy_intp *) PyArray_DATA(olevel);
+	line_start[0] = 0;
+	n = 0;
+	for ( m = 0; m < nlevels; m++ )
+	{
+		level_start[m] = n;
+		for ( i = 0; i < s[m].nlines + s[m].nclosed; i++ )
+		{
+			k = _stitch_nth_line( &s[m], i );
+			if ( k < 0 )
+				continue;
+			line_start[n+1] = line_start[n] + _stitch_line_copy( &s[m], k,
+				BGL_DArray1_ptr(xs,line_start[n]),
+				BGL_DArray1_ptr(ys,line_start[n]) );
+			n++;
+		}
+		_stitch_free( &s[m] );
+	}
+	level_start[nlevels] = n;
+	Py_END_ALLOW_THREADS
+
+	ret = Py_BuildValue( "OOOOn", xs, ys, oline, olevel, nbad );
+
+quit:
+	for ( m = 0; segs != NULL && s != NULL && m < nlevels; m++ )
+	{
+		_segs_free( &segs[m] );
+		_stitch_free( &s[m] );
+	}
+	BGL_Free( order );
+	BGL_Free( sorted );
+	BGL_Free( segs );
+	BGL_Free( s );
+	Py_XDECREF(xs);
+	Py_XDECREF(ys);
+	Py_XDECREF(oline);
+	Py_XDECREF(olevel);
+	Py_XDECREF(x);
+	Py_XDECREF(y);
+	Py_XDECREF(z);
+	Py_XDECREF(levels);
+	return ret;
+}
+
 /******************************************************************************
  *  hammer.py
  */
@@ -267,6 +1073,18 @@ _lb_input( double l, double b, double l0, double b0, double rot,
 	_x_rotate( r, s, rot, ll, bb );
 }
 
+/* the inverse of _lb_input */
+static void
+_lb_output( double ll, double bb, double l0, double b0, double rot,
+	double *l, double *b )
+{
+	double p, q, r, s;
+
+	_x_rotate( ll, bb, -rot, &p, &q );
+	_y_rotate( p, q, b0, &r, &s );
+	_z_rotate( r, s, l0, l, b );
+}
+
 static void
 _lb2uv( double l, double b, double *u, double *v )
 {
@@ -276,6 +1094,20 @@ _lb2uv( double l, double b, double *u, double *v )
 	*v = 0.5*sin(b)/q;
 }
 
+/*
+ *  The inverse of _lb2uv, for (u,v) inside the ellipse u^2 + 4v^2 <= 1.
+ */
+static void
+_uv2lb( double u, double v, double *l, double *b )
+{
+	double z, t;
+
+	z = sqrt( 1. - 0.5*u*u - 2.*v*v );
+	*l = 2.*atan2( 2.*M_SQRT2*z*u, 2.*(2.*z*z - 1.) );
+	t = 2.*M_SQRT2*z*v;
+	*b = asin( BGL_MAX(-1., BGL_MIN(t, 1.)) );
+}
+
 static PyObject *
 biggles_hammer_call( PyObject *self, PyObject *args )
 {
@@ -306,8 +1138,8 @@ biggles_hammer_call_vec( PyObject *self, PyObject *args )
 		return NULL;
 
     // 1-d C contiguous
-	l = PyArray_ContiguousFromAny( ol, NPY_DOUBLE, 1, 1 );
-	b = PyArray_ContiguousFromAny( ob, NPY_DOUBLE, 1, 1 );
+	l = _bgl_array( ol, 1 );
+	b = _bgl_array( ob, 1 );
 
 	if ( l == NULL || b == NULL )
 		goto quit0;
@@ -320,12 +1152,14 @@ biggles_hammer_call_vec( PyObject *self, PyObject *args )
 	if ( u == NULL || v == NULL )
 		goto quit1;
 
+	Py_BEGIN_ALLOW_THREADS
 	for ( i = 0; i < n; i++ )
 	{
-		_lb_input( BGL_DArray1(l,i), BGL_DArray1(b,i),
+		_lb_input( BGL_Array1(l,i), BGL_Array1(b,i),
 			l0, b0, rot, &ll, &bb );
 		_lb2uv( ll, bb, BGL_DArray1_ptr(u,i), BGL_DArray1_ptr(v,i) );
 	}
+	Py_END_ALLOW_THREADS
 
 	ret = Py_BuildValue( "OO", u, v );
 
@@ -375,12 +1209,13 @@ biggles_hammer_geodesic_fill( PyObject *self, PyObject *args )
 	npy_intp i, n, dims[1];
 
 	ref = NULL;
+	l2 = b2 = NULL;
 
 	if ( !PyArg_ParseTuple(args, "OOi", &ol, &ob, &div) )
 		return NULL;
 
-	l = PyArray_ContiguousFromAny( ol, NPY_DOUBLE, 1, 1 );
-	b = PyArray_ContiguousFromAny( ob, NPY_DOUBLE, 1, 1 );
+	l = _bgl_array( ol, 1 );
+	b = _bgl_array( ob, 1 );
 
 	if ( l == NULL || b == NULL )
 	{	
@@ -390,6 +1225,12 @@ biggles_hammer_geodesic_fill( PyObject *self, PyObject *args )
 	}
 
 	n = PyArray_SIZE(l);
+	if ( PyArray_SIZE(b) != n )
+	{
+		PyErr_SetString( PyExc_ValueError,
+			"l and b have different lengths" );
+		goto quit;
+	}
 	dims[0] = (n-1)*div + 1;
 
 	l2 = PyArray_ZEROS( 1, dims, NPY_DOUBLE, 0);
@@ -398,13 +1239,15 @@ biggles_hammer_geodesic_fill( PyObject *self, PyObject *args )
 	if ( l2 == NULL || b2 == NULL )
 		goto quit;
 
+	Py_BEGIN_ALLOW_THREADS
 	for ( i = 0; i < n-1; i++ ) {
 		_lb_geodesic( div,
-			BGL_DArray1(l,i), BGL_DArray1(b,i),
-			BGL_DArray1(l,i+1), BGL_DArray1(b,i+1),
+			BGL_Array1(l,i), BGL_Array1(b,i),
+			BGL_Array1(l,i+1), BGL_Array1(b,i+1),
             BGL_DArray1_ptr(l2, i*div),
             BGL_DArray1_ptr(b2, i*div));
     }
+	Py_END_ALLOW_THREADS
 
 	ref = Py_BuildValue( "OO", l2, b2 );
 quit:
@@ -415,6 +1258,188 @@ quit:
 	return ref;
 }
 
+/*
+ *  Adaptive geodesics.
+ *
+ *  Each step of the curve is bisected along its great circle until the
+ *  projected midpoint lies within tol (in Hammer units) of the chord
+ *  between the projected ends, so only the steps that actually bend on
+ *  the map get extra points. A step that wraps around the edge of the
+ *  map is bisected down to BGL_GEODESIC_DEPTH, to put points close to
+ *  the edge on both sides.
+ */
+
+#define BGL_GEODESIC_DEPTH	12
+
+/*
+ *  Whether a step between points with rotated longitudes of sine and
+ *  cosine p[0], p[1] and q[0], q[1] crosses the back of the sphere, and
+ *  so wraps around the map.
+ */
+#define BGL_WRAPS(p,q)\
+	((p)[0]*(q)[0] < 0. && (p)[1] + (q)[1] < 0.)
+
+typedef struct {
+	double *lb;
+	npy_intp n, cap;
+} BGL_Track;
+
+typedef struct {
+	double l, b;		/* on the sky */
+	double u, v;		/* projected */
+	double sc[2];		/* sin & cos of the rotated longitude */
+} BGL_TrackPoint;
+
+static int
+_track_add( BGL_Track *t, double l, double b )
+{
+	double *tmp;
+
+	if ( t->n == t->cap )
+	{
+		t->cap = 2*t->cap + 256;
+		tmp = BGL_Realloc( t->lb, 2*t->cap*sizeof(double) );
+		if ( tmp == NULL )
+			return -1;
+		t->lb = tmp;
+	}
+	t->lb[2*t->n] = l;
+	t->lb[2*t->n+1] = b;
+	t->n++;
+	return 0;
+}
+
+static void
+_track_point( double l, double b, double l0, double b0, double rot,
+	BGL_TrackPoint *p )
+{
+	double ll, bb;
+
+	p->l = l;
+	p->b = b;
+	_lb_input( l, b, l0, b0, rot, &ll, &bb );
+	_lb2uv( ll, bb, &p->u, &p->v );
+	p->sc[0] = sin(ll);
+	p->sc[1] = cos(ll);
+}
+
+/* adds the points strictly between p and q */
+static int
+_track_refine( BGL_Track *t, BGL_TrackPoint *p, BGL_TrackPoint *q,
+	double l0, double b0, double rot, double tol, int depth )
+{
+	BGL_TrackPoint m;
+	double l[3], b[3];
+	double du, dv;
+
+	if ( depth == 0 )
+		return 0;
+
+	_lb_geodesic( 2, p->l, p->b, q->l, q->b, l, b );
+	_track_point( l[1], b[1], l0, b0, rot, &m );
+
+	if ( !BGL_WRAPS(p->sc, q->sc) )
+	{
+		du = m.u - 0.5*(p->u + q->u);
+		dv = m.v - 0.5*(p->v + q->v);
+		if ( !(du*du + dv*dv > tol*tol) )
+			return 0;
+	}
+
+	if ( _track_refine(t, p, &m, l0, b0, rot, tol, depth-1) < 0 )
+		return -1;
+	if ( _track_add(t, m.l, m.b) < 0 )
+		return -1;
+	return _track_refine( t, &m, q, l0, b0, rot, tol, depth-1 );
+}
+
+static int
+_track_curve( BGL_Track *t, PyObject *l, PyObject *b, npy_intp n,
+	double l0, double b0, double rot, double tol )
+{
+	BGL_TrackPoint p, q;
+	npy_intp i;
+
+	for ( i = 0; i < n; i++ )
+	{
+		_track_point( BGL_Array1(l,i), BGL_Array1(b,i),
+			l0, b0, rot, &q );
+		if ( i > 0 && _track_refine(t, &p, &q, l0, b0, rot, tol,
+				BGL_GEODESIC_DEPTH) < 0 )
+			return -1;
+		if ( _track_add(t, q.l, q.b) < 0 )
+			return -1;
+		p = q;
+	}
+	return 0;
+}
+
+static PyObject *
+biggles_hammer_geodesic_adaptive( PyObject *self, PyObject *args )
+{
+	PyObject *ol, *ob, *ret;
+	PyObject *l, *b, *l2, *b2;
+	double l0, b0, rot, tol;
+	BGL_Track t;
+	npy_intp i, n;
+	int err;
+
+	ret = NULL;
+	l2 = b2 = NULL;
+	memset( &t, 0, sizeof(t) );
+
+	if ( !PyArg_ParseTuple(args, "OOdddd",
+			&ol, &ob, &l0, &b0, &rot, &tol) )
+		return NULL;
+
+	l = _bgl_array( ol, 1 );
+	b = _bgl_array( ob, 1 );
+
+	if ( l == NULL || b == NULL )
+		goto quit;
+
+	n = PyArray_SIZE(l);
+	if ( PyArray_SIZE(b) != n )
+	{
+		PyErr_SetString( PyExc_ValueError,
+			"l and b have different lengths" );
+		goto quit;
+	}
+
+	Py_BEGIN_ALLOW_THREADS
+	err = _track_curve( &t, l, b, n, l0, b0, rot, tol );
+	Py_END_ALLOW_THREADS
+
+	if ( err < 0 )
+	{
+		PyErr_NoMemory();
+		goto quit;
+	}
+
+	l2 = PyArray_SimpleNew( 1, &t.n, NPY_DOUBLE );
+	b2 = PyArray_SimpleNew( 1, &t.n, NPY_DOUBLE );
+
+	if ( l2 == NULL || b2 == NULL )
+		goto quit;
+
+	Py_BEGIN_ALLOW_THREADS
+	for ( i = 0; i < t.n; i++ )
+	{
+		*BGL_DArray1_ptr(l2,i) = t.lb[2*i];
+		*BGL_DArray1_ptr(b2,i) = t.lb[2*i+1];
+	}
+	Py_END_ALLOW_THREADS
+
+	ret = Py_BuildValue( "OO", l2, b2 );
+quit:
+	BGL_Free( t.lb );
+	Py_XDECREF(l);
+	Py_XDECREF(b);
+	Py_XDECREF(l2);
+	Py_XDECREF(b2);
+	return ret;
+}
+
 static PyObject *
 biggles_hammer_connect( PyObject *self, PyObject *args )
 {
@@ -435,6 +1460,226 @@ biggles_hammer_connect( PyObject *self, PyObject *args )
 	return Py_BuildValue( "i", connect );
 }
 
+/*
+ *  The indices i at which the curve (l, b) jumps across the edge of the
+ *  map between points i-1 and i. Unlike hammer_connect, a step across
+ *  the central meridian is not a break.
+ */
+static PyObject *
+biggles_hammer_breaks( PyObject *self, PyObject *args )
+{
+	PyObject *ol, *ob, *ret;
+	PyObject *l, *b, *breaks;
+	double l0, b0, rot;
+	double ll, bb, *sc;
+	npy_intp i, n, nbreaks, *out;
+
+	ret = NULL;
+	breaks = NULL;
+	sc = NULL;
+
+	if ( !PyArg_ParseTuple(args, "OOddd", &ol, &ob, &l0, &b0, &rot) )
+		return NULL;
+
+	l = _bgl_array( ol, 1 );
+	b = _bgl_array( ob, 1 );
+
+	if ( l == NULL || b == NULL )
+		goto quit;
+
+	n = PyArray_SIZE(l);
+	if ( PyArray_SIZE(b) != n )
+	{
+		PyErr_SetString( PyExc_ValueError,
+			"l and b have different lengths" );
+		goto quit;
+	}
+
+	sc = BGL_New( double, 2*n + 2 );
+	if ( sc == NULL )
+	{
+		PyErr_NoMemory();
+		goto quit;
+	}
+
+	nbreaks = 0;
+	Py_BEGIN_ALLOW_THREADS
+	for ( i = 0; i < n; i++ )
+	{
+		_lb_input( BGL_Array1(l,i), BGL_Array1(b,i),
+			l0, b0, rot, &ll, &bb );
+		sc[2*i] = sin(ll);
+		sc[2*i+1] = cos(ll);
+		if ( i > 0 && BGL_WRAPS(sc+2*i-2, sc+2*i) )
+			nbreaks++;
+	}
+	Py_END_ALLOW_THREADS
+
+	breaks = PyArray_SimpleNew( 1, &nbreaks, NPY_INTP );
+	if ( breaks == NULL )
+		goto quit;
+
+	out = (npy_intp *) PyArray_DATA(breaks);
+	for ( i = 1; i < n; i++ )
+		if ( BGL_WRAPS(sc+2*i-2, sc+2*i) )
+			*out++ = i;
+
+	ret = breaks;
+	breaks = NULL;
+quit:
+	BGL_Free( sc );
+	Py_XDECREF(l);
+	Py_XDECREF(b);
+	Py_XDECREF(breaks);
+	return ret;
+}
+
+/*
+ *  Sky density maps.
+ *
+ *  The sky is binned uniformly in l and in sin(b), so every bin covers
+ *  the same area. A map is drawn by taking each cell of the output
+ *  raster back through the projection and the view rotation to the
+ *  sky, and reading the bin it lands in, so the cost depends on the
+ *  size of the raster and not on the number of positions binned.
+ */
+
+static int
+_sky_bin( double l, double b, npy_intp nl, npy_intp nb,
+	npy_intp *il, npy_intp *ib )
+{
+	double t;
+
+	if ( l != l || b != b )
+		return 0;
+
+	t = fmod( (l + M_PI)/(2.*M_PI), 1. );
+	if ( t < 0. )
+		t += 1.;
+	*il = BGL_MIN( (npy_intp) (t*nl), nl-1 );
+
+	t = 0.5*(sin(b) + 1.);
+	*ib = (npy_intp) (t*nb);
+	if ( *ib < 0 )
+		*ib = 0;
+	if ( *ib > nb-1 )
+		*ib = nb-1;
+	return 1;
+}
+
+/*
+ *  Adds the positions (l, b), in radians, to the bin counts, a writable
+ *  [nl, nb] array of doubles.
+ */
+static PyObject *
+biggles_sky_bin( PyObject *self, PyObject *args )
+{
+	PyObject *ol, *ob, *counts;
+	PyObject *l, *b;
+	npy_intp i, n, nl, nb, il, ib;
+	double *c;
+
+	if ( !PyArg_ParseTuple(args, "OOO", &ol, &ob, &counts) )
+		return NULL;
+
+	if ( !PyArray_Check(counts) || PyArray_NDIM(counts) != 2
+			|| PyArray_TYPE(counts) != NPY_DOUBLE
+			|| !PyArray_ISCARRAY(counts) )
+	{
+		PyErr_SetString( PyExc_TypeError,
+			"counts must be a writable, contiguous 2-d float64 array" );
+		return NULL;
+	}
+
+	l = _bgl_array( ol, 1 );
+	b = _bgl_array( ob, 1 );
+
+	if ( l == NULL || b == NULL )
+		goto quit;
+
+	n = PyArray_SIZE(l);
+	if ( PyArray_SIZE(b) != n )
+	{
+		PyErr_SetString( PyExc_ValueError,
+			"l and b have different lengths" );
+		goto quit;
+	}
+	nl = PyArray_DIM(counts,0);
+	nb = PyArray_DIM(counts,1);
+	c = (double *) PyArray_DATA(counts);
+
+	Py_BEGIN_ALLOW_THREADS
+	for ( i = 0; i < n; i++ )
+		if ( _sky_bin(BGL_Array1(l,i), BGL_Array1(b,i),
+				nl, nb, &il, &ib) )
+			c[il*nb + ib] += 1.;
+	Py_END_ALLOW_THREADS
+
+quit:
+	Py_XDECREF(l);
+	Py_XDECREF(b);
+	if ( PyErr_Occurred() )
+		return NULL;
+	Py_RETURN_NONE;
+}
+
+/*
+ *  An [nx, ny] raster of the Hammer-Aitoff map of the bins, covering
+ *  the projection's bounding box (-1,-1/2) to (1,1/2). Cells outside
+ *  the map's ellipse are NaN.
+ */
+static PyObject *
+biggles_hammer_sky_raster( PyObject *self, PyObject *args )
+{
+	PyObject *ocounts, *counts, *raster;
+	double l0, b0, rot;
+	double u, v, ll, bb, l, b, *c, *r;
+	npy_intp i, j, nx, ny, nl, nb, il, ib, dims[2];
+
+	raster = NULL;
+
+	if ( !PyArg_ParseTuple(args, "Onnddd", &ocounts, &nx, &ny,
+			&l0, &b0, &rot) )
+		return NULL;
+
+	counts = PyArray_ContiguousFromAny( ocounts, NPY_DOUBLE, 2, 2 );
+	if ( counts == NULL )
+		return NULL;
+
+	nl = PyArray_DIM(counts,0);
+	nb = PyArray_DIM(counts,1);
+	c = (double *) PyArray_DATA(counts);
+
+	dims[0] = BGL_MAX( nx, 0 );
+	dims[1] = BGL_MAX( ny, 0 );
+	raster = PyArray_SimpleNew( 2, dims, NPY_DOUBLE );
+	if ( raster == NULL )
+		goto quit;
+	r = (double *) PyArray_DATA(raster);
+
+	Py_BEGIN_ALLOW_THREADS
+	for ( i = 0; i < dims[0]; i++ )
+	{
+		u = -1. + (i + 0.5)*2./dims[0];
+		for ( j = 0; j < dims[1]; j++ )
+		{
+			v = -0.5 + (j + 0.5)/dims[1];
+			r[i*dims[1] + j] = Py_NAN;
+			if ( u*u + 4.*v*v > 1. )
+				continue;
+			_uv2lb( u, v, &ll, &bb );
+			_lb_output( ll, bb, l0, b0, rot, &l, &b );
+			if ( nl > 0 && nb > 0 && _sky_bin(l, b, nl, nb, &il, &ib) )
+				r[i*dims[1] + j] = c[il*nb + ib];
+		}
+	}
+	Py_END_ALLOW_THREADS
+
+quit:
+	Py_DECREF(counts);
+	return raster;
+}
+
 /******************************************************************************
  *  module init
  */
@@ -444,12 +1689,19 @@ static PyMethodDef BigglesMethods[] =
 
 	/* contour.py */
 	{ "contour_segments", biggles_contour_segments, METH_VARARGS },
+	{ "contour_lines", biggles_contour_lines, METH_VARARGS },
+	{ "contour_levels", biggles_contour_levels, METH_VARARGS },
 
 	/* hammer.py */
 	{ "hammer_call", biggles_hammer_call, METH_VARARGS },
 	{ "hammer_call_vec", biggles_hammer_call_vec, METH_VARARGS },
 	{ "hammer_connect", biggles_hammer_connect, METH_VARARGS },
+	{ "hammer_breaks", biggles_hammer_breaks, METH_VARARGS },
+	{ "hammer_sky_raster", biggles_hammer_sky_raster, METH_VARARGS },
+	{ "sky_bin", biggles_sky_bin, METH_VARARGS },
 	{ "hammer_geodesic_fill", biggles_hammer_geodesic_fill, METH_VARARGS },
+	{ "hammer_geodesic_adaptive", biggles_hammer_geodesic_adaptive,
+		METH_VARARGS },
 
 	{ NULL, NULL }
 };
@@ -25,6 +25,7 @@ import math
 import os
 import numpy
 import tempfile
+import threading
 import warnings
 
 from . import config, _biggles
@@ -59,10 +60,9 @@ def _ceil(x):
     return long(math.ceil(x))
 
 
-def _tsil(x):
-    l = list(x)
-    l.reverse()
-    return l
+def _interleave(*arrays):
+    "Returns [a[0], b[0], ..., a[1], b[1], ...] for arrays a, b, ..."
+    return numpy.column_stack(arrays).ravel()
 
 
 def _message(s):
@@ -80,6 +80,52 @@ def _first_not_none(*args):
     return None
 
 
+# smallest piece of work worth a thread of its own
+_THREAD_MIN_SIZE = 1 << 16
+
+
+def _thread_bounds(n, size=1):
+    """
+    Splits n items, of about size units of work each, into as many
+    ranges as there are threads to run them, but none smaller than
+    _THREAD_MIN_SIZE units.  Returns the bounds of the ranges.
+    """
+    nthreads = int(config.value('default', 'threads', 1))
+    if nthreads < 1:
+        import multiprocessing
+        nthreads = multiprocessing.cpu_count()
+    k = max(min(nthreads, n * size // _THREAD_MIN_SIZE, n), 1)
+    return [n * i // k for i in range(k + 1)]
+
+
+def _thread_map(func, args):
+    """
+    Returns [func(*a) for a in args], running each call on its own
+    thread.  The kernels in _biggles release the GIL, so calls to them
+    run in parallel.
+    """
+    results = [None] * len(args)
+    errors = []
+
+    def run(i):
+        try:
+            results[i] = func(*args[i])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,))
+               for i in range(1, len(args))]
+    for t in threads:
+        t.start()
+    if len(args) > 0:
+        run(0)
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
 class _Alias(object):
 
     def __init__(self, *args):
@@ -181,6 +227,12 @@ class _PlotContext(object):
         self.geom = _PlotGeometry(data, dev, xlog=xlog, ylog=ylog)
         self.plot_geom = _PlotGeometry(BoundingBox((0, 0), (1, 1)), dev)
 
+    def cache_key(self):
+        return (getattr(self.draw, 'page_id', None),
+                self.dev_bbox.p0, self.dev_bbox.p1,
+                self.data_bbox.p0, self.data_bbox.p1,
+                self.xlog, self.ylog)
+
     def do_clip(self):
         xr = self.dev_bbox.xrange()
         yr = self.dev_bbox.yrange()
@@ -480,6 +532,32 @@ class _LineObject(_DeviceObject):
         context.draw.line(self.p, self.q)
 
 
+class _SegmentsObject(_DeviceObject):
+
+    kw_rename = {
+        'color': 'linecolor',
+        'width': 'linewidth',
+        'type': 'linetype',
+    }
+
+    def __init__(self, x0, y0, x1, y1, **kw):
+        self.kw_init(kw)
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x1
+        self.y1 = y1
+
+    def bbox(self, context):
+        if len(self.x0) == 0:
+            return BoundingBox()
+        xmin, xmax = _range(numpy.concatenate((self.x0, self.x1)))
+        ymin, ymax = _range(numpy.concatenate((self.y0, self.y1)))
+        return BoundingBox((xmin, ymin), (xmax, ymax))
+
+    def draw(self, context):
+        context.draw.segments(self.x0, self.y0, self.x1, self.y1)
+
+
 class _PolygonObject(_DeviceObject):
 
     kw_rename = {
@@ -487,15 +565,57 @@ class _PolygonObject(_DeviceObject):
         'type': 'linetype',
     }
 
-    def __init__(self, points, **kw):
+    def __init__(self, x, y, **kw):
         self.kw_init(kw)
-        self.points = points
+        self.x = x
+        self.y = y
 
     def bbox(self, context):
-        return BoundingBox(*self.points)
+        xmin, xmax = _range(self.x)
+        ymin, ymax = _range(self.y)
+        return BoundingBox((xmin, ymin), (xmax, ymax))
 
     def draw(self, context):
-        context.draw.polygon(self.points)
+        context.draw.polygon(self.x, self.y)
+
+
+def _decimate_path(x, y, width=1.):
+    """
+    Reduces the path (x, y), in device coordinates, to the points which
+    can make a visible difference at a resolution of width.
+
+    Consecutive points falling in the same device column are replaced by
+    the first, lowest, highest and last of them, in their original order.
+    Points with a NaN y are kept, so the path breaks where it did before.
+    """
+    x = numpy.asarray(x)
+    y = numpy.asarray(y)
+    n = len(x)
+    if n < 5:
+        return x, y
+
+    col = numpy.floor(x / width)
+    start = numpy.flatnonzero(col[1:] != col[:-1]) + 1
+    start = numpy.concatenate(([0], start))
+    end = numpy.concatenate((start[1:], [n])) - 1
+    if len(start) * 4 >= n:
+        return x, y
+
+    run = numpy.zeros(n, numpy.intp)
+    run[start[1:]] = 1
+    run = numpy.cumsum(run)
+
+    keep = numpy.zeros(n, bool)
+    keep[start] = True
+    keep[end] = True
+    keep[numpy.isnan(y)] = True
+    for extreme in (numpy.fmin, numpy.fmax):
+        # the first point of each run which attains the run's extreme
+        hit = numpy.flatnonzero(y == extreme.reduceat(y, start)[run])
+        first = numpy.concatenate(([True], run[hit][1:] != run[hit][:-1]))
+        keep[hit[first]] = True
+
+    return x[keep], y[keep]
 
 
 class _PathObject(_DeviceObject):
@@ -519,6 +639,22 @@ class _PathObject(_DeviceObject):
         context.draw.curve(self.x, self.y)
 
 
+def _last_in_cell(x, y, width=1.):
+    """
+    Returns, in drawing order, the indices of the points (x, y) which
+    are the last to be drawn in their width x width device cell.
+    """
+    i = numpy.floor(numpy.asarray(x) / width)
+    j = numpy.floor(numpy.asarray(y) / width)
+    # lexsort is stable, so each cell's points stay in drawing order
+    order = numpy.lexsort((j, i))
+    i = i[order]
+    j = j[order]
+    last = numpy.ones(len(order), bool)
+    last[:-1] = (i[1:] != i[:-1]) | (j[1:] != j[:-1])
+    return numpy.sort(order[last])
+
+
 class _SymbolsObject(_DeviceObject):
 
     kw_rename = {
@@ -608,22 +744,6 @@ class _EllipseObject(_DeviceObject):
         context.draw.ellipse(self.p, self.rx, self.ry, self.angle)
 
 
-class _CombObject(_DeviceObject):
-
-    def __init__(self, points, dp, **kw):
-        self.kw_init(kw)
-        self.points = points
-        self.dp = dp
-
-    def bbox(self, context):
-        return BoundingBox(*self.points)
-
-    def draw(self, context):
-        for p in self.points:
-            context.draw.move(p)
-            context.draw.linetorel(self.dp)
-
-
 class _BoxObject(_DeviceObject):
 
     def __init__(self, p, q, **kw):
@@ -657,6 +777,11 @@ class _ArcObject(_DeviceObject):
 
 class _PlotComponent(_StyleKeywords, _ConfAttributes):
 
+    # the device objects from the last make() are reused as long as the
+    # context geometry is unchanged and the component hasn't been modified
+    _make_key = None
+    _make_dirty = True
+
     def __init__(self, **kw):
         label=kw.get('label',None)
         if label is not None:
@@ -664,6 +789,20 @@ class _PlotComponent(_StyleKeywords, _ConfAttributes):
 
         self.clear()
 
+    def __setattr__(self, name, value):
+        super(_PlotComponent, self).__setattr__(name, value)
+        self.__dict__['_make_dirty'] = True
+
+    def invalidate(self):
+        """
+        Force the device objects to be regenerated on the next draw.
+        """
+        self.__dict__['_make_dirty'] = True
+
+    def kw_set(self, key, value):
+        super(_PlotComponent, self).kw_set(key, value)
+        self.__dict__['_make_dirty'] = True
+
     def add(self, *args):
         for obj in args:
             self.device_objects.append(obj)
@@ -680,17 +819,23 @@ class _PlotComponent(_StyleKeywords, _ConfAttributes):
     def make_key(self, bbox):
         pass
 
+    def _make_cached(self, context):
+        key = context.cache_key()
+        if self._make_dirty or key != self._make_key:
+            self.clear()
+            self.make(context)
+            self.__dict__['_make_key'] = key
+            self.__dict__['_make_dirty'] = False
+
     def bbox(self, context):
-        self.clear()
-        self.make(context)
+        self._make_cached(context)
         bb = BoundingBox()
         for obj in self.device_objects:
             bb.union(obj.bbox(context))
         return bb
 
     def render(self, context):
-        self.clear()
-        self.make(context)
+        self._make_cached(context)
         self.kw_predraw(context)
         for obj in self.device_objects:
             obj.render(context)
@@ -806,6 +951,12 @@ class Curve(_LineComponent):
             The "x" values of each point, to be connected by lines.
     y: array or sequence
             The "y" values of each point, to be connected by lines..
+    decimate: bool
+        If True, only draw the points which make a visible difference
+        at the output resolution: runs of points within one device
+        unit in x are reduced to their first, lowest, highest and last
+        points.  Useful for curves with many more points than the
+        device has pixels.  Default False.
 
     **keywords
             Style and other keywords for the Curve.
@@ -814,12 +965,13 @@ class Curve(_LineComponent):
             into here)
     """
 
-    def __init__(self, x, y, **kw):
+    def __init__(self, x, y, decimate=False, **kw):
         super(Curve,self).__init__(**kw)
         self.conf_setattr("Curve")
         self.kw_init(kw)
         self.x = x
         self.y = y
+        self.decimate = decimate
 
     def limits(self):
         p0 = min(self.x), min(self.y)
@@ -830,6 +982,8 @@ class Curve(_LineComponent):
         segs = context.geom.geodesic(self.x, self.y)
         for seg in segs:
             x, y = context.geom.call_vec(seg[0], seg[1])
+            if self.decimate:
+                x, y = _decimate_path(x, y)
             self.add(_PathObject(x, y))
 
 
@@ -1167,6 +1321,11 @@ class Points(_SymbolDataComponent):
             The "x" values of each point.
     y: array or sequence
             The "y" values of each point.
+    dedup: bool
+        If True, only draw the last of the points falling in each
+        device unit (pixel) cell.  The plot looks the same but the
+        drawing cost is bounded by the output resolution.  Useful for
+        very large numbers of points.  Default False.
 
     **keywords
             Style and other keywords for the Points.
@@ -1180,12 +1339,13 @@ class Points(_SymbolDataComponent):
         'symbolsize': config.value('Points', 'symbolsize'),
     }
 
-    def __init__(self, x, y, **kw):
+    def __init__(self, x, y, dedup=False, **kw):
         super(Points,self).__init__(**kw)
         self.conf_setattr("Points")
         self.kw_init(kw)
 
         self._set_xy(x, y)
+        self.dedup = dedup
 
     def _set_xy(self, x, y):
         """
@@ -1212,6 +1372,9 @@ class Points(_SymbolDataComponent):
 
     def make(self, context):
         x, y = context.geom.call_vec(self.x, self.y)
+        if self.dedup:
+            keep = _last_in_cell(x, y)
+            x, y = x[keep], y[keep]
         self.add(_SymbolsObject(x, y))
 
 Point=Points
@@ -1228,7 +1391,15 @@ class ColoredPoints(_SymbolDataComponent):
             The "y" values of each point.
     c: array or sequence
             Colors for each point. These must be floats, unlike
-            other colors
+            other colors.  If palette is given, these are instead
+            integer indices into the palette.
+    palette: array or sequence, optional
+        An [ncolors, 3] array of float colors.  The points are then
+        drawn grouped by color, so the color only has to be changed
+        once per palette entry.
+    dedup: bool
+        If True, only draw the last of the points falling in each
+        device unit (pixel) cell.  See Points.  Default False.
 
     **keywords
             Style and other keywords for the Points.
@@ -1242,13 +1413,21 @@ class ColoredPoints(_SymbolDataComponent):
         'symbolsize': config.value('Points', 'symbolsize'),
     }
 
-    def __init__(self, x, y, c=None, **kw):
+    def __init__(self, x, y, c=None, palette=None, dedup=False, **kw):
         super(ColoredPoints,self).__init__(**kw)
         self.conf_setattr("Points")
         self.kw_init(kw)
 
+        self._set_palette(palette)
         self._set_xyc(x, y, c)
+        self.dedup = dedup
 
+    def _set_palette(self, palette):
+        if palette is not None:
+            palette = numpy.array(palette, ndmin=2, copy=False)
+            if palette.shape[1] != 3:
+                raise RuntimeError("palette must be an rgb array [ncolors, 3]")
+        self.palette = palette
 
     def _set_xyc(self, x, y, c):
         """
@@ -1259,7 +1438,14 @@ class ColoredPoints(_SymbolDataComponent):
         y = numpy.array(y, ndmin=1, copy=False)
         c = numpy.array(c, ndmin=1, copy=False)
         
-        if c.shape[1] != 3:
+        if self.palette is not None:
+            if c.ndim != 1 or c.dtype.kind not in 'iu':
+                raise RuntimeError("c must be an integer array [npts] "
+                                   "when using a palette")
+            if c.size > 0 and (c.min() < 0 or c.max() >= len(self.palette)):
+                raise ValueError("palette indices must be in "
+                                 "[0, %d)" % len(self.palette))
+        elif c.ndim != 2 or c.shape[1] != 3:
             raise RuntimeError("c must be an rgby array [npts, 3]")
 
         lc=c.shape[0]
@@ -1285,7 +1471,15 @@ class ColoredPoints(_SymbolDataComponent):
 
     def make(self, context):
         x, y = context.geom.call_vec(self.x, self.y)
-        self.add(_ColoredSymbolsObject(x, y, self.c))
+        c = self.c
+        if self.dedup:
+            keep = _last_in_cell(x, y)
+            x, y, c = x[keep], y[keep], c[keep]
+        if self.palette is not None:
+            order = numpy.argsort(c, kind='mergesort')
+            x, y = x[order], y[order]
+            c = self.palette[c[order]]
+        self.add(_ColoredSymbolsObject(x, y, c))
 
 ColoredPoint=ColoredPoints
 
@@ -1299,7 +1493,9 @@ class Density(_PlotComponent):
     parameters
     ----------
     densgrid/image:
-            The image or density grid.
+            The image or density grid, [nx, ny] for gray levels or
+            [nx, ny, 3] for colors.  Values are floats in [0, 1], or
+            uint8 in [0, 255], which are used without conversion.
     extent:
             extent = ( (xmin,ymin), (xmax,ymax) )
 
@@ -1364,11 +1560,11 @@ class FillAbove(_FillComponent):
         return BoundingBox(p, q)
 
     def make(self, context):
-        coords = map(context.geom, self.x, self.y)
         max_y = context.data_bbox.yrange()[1]
-        coords.append(context.geom(self.x[-1], max_y))
-        coords.append(context.geom(self.x[0], max_y))
-        self.add(_PolygonObject(coords))
+        x = numpy.concatenate((self.x, (self.x[-1], self.x[0])))
+        y = numpy.concatenate((self.y, (max_y, max_y)))
+        x, y = context.geom.call_vec(x, y)
+        self.add(_PolygonObject(x, y))
 
 
 class FillBelow(_FillComponent):
@@ -1386,11 +1582,11 @@ class FillBelow(_FillComponent):
         return BoundingBox(p, q)
 
     def make(self, context):
-        coords = map(context.geom, self.x, self.y)
         min_y = context.data_bbox.yrange()[0]
-        coords.append(context.geom(self.x[-1], min_y))
-        coords.append(context.geom(self.x[0], min_y))
-        self.add(_PolygonObject(coords))
+        x = numpy.concatenate((self.x, (self.x[-1], self.x[0])))
+        y = numpy.concatenate((self.y, (min_y, min_y)))
+        x, y = context.geom.call_vec(x, y)
+        self.add(_PolygonObject(x, y))
 
 
 class FillBetween(_FillComponent):
@@ -1410,10 +1606,10 @@ class FillBetween(_FillComponent):
         return BoundingBox((min_x, min_y), (max_x, max_y))
 
     def make(self, context):
-        x = list(self.x1) + _tsil(self.x2)
-        y = list(self.y1) + _tsil(self.y2)
-        coords = map(context.geom, x, y)
-        self.add(_PolygonObject(coords))
+        x = numpy.concatenate((self.x1, numpy.asarray(self.x2)[::-1]))
+        y = numpy.concatenate((self.y1, numpy.asarray(self.y2)[::-1]))
+        x, y = context.geom.call_vec(x, y)
+        self.add(_PolygonObject(x, y))
 
 # Polygons --------------------------------------------------------------------
 
@@ -1436,7 +1632,7 @@ class Polygon(_FillComponent):
 
     def make(self, context):
         x, y = context.geom.call_vec(self.x, self.y)
-        self.add(_PolygonObject(zip(x, y)))
+        self.add(_PolygonObject(x, y))
 
 # ErrorBars -------------------------------------------------------------------
 
@@ -1497,13 +1693,14 @@ class ErrorBarsX(_ErrorBar):
 
     def make(self, context):
         l = _size_relative(self.barsize, context.dev_bbox)
-        for i in range(len(self.y)):
-            p = context.geom(self.lo[i], self.y[i])
-            q = context.geom(self.hi[i], self.y[i])
-            l0 = _LineObject(p, q)
-            l1 = _LineObject((p[0], p[1] - l), (p[0], p[1] + l))
-            l2 = _LineObject((q[0], q[1] - l), (q[0], q[1] + l))
-            self.add(l0, l1, l2)
+        px, py = context.geom.call_vec(self.lo, self.y)
+        qx, qy = context.geom.call_vec(self.hi, self.y)
+        # the bar and both end caps for each point
+        x0 = _interleave(px, px, qx)
+        y0 = _interleave(py, py - l, qy - l)
+        x1 = _interleave(qx, px, qx)
+        y1 = _interleave(qy, py + l, qy + l)
+        self.add(_SegmentsObject(x0, y0, x1, y1))
 
 
 class ErrorBarsY(_ErrorBar):
@@ -1545,13 +1742,14 @@ class ErrorBarsY(_ErrorBar):
 
     def make(self, context):
         l = _size_relative(self.barsize, context.dev_bbox)
-        for i in range(len(self.x)):
-            p = context.geom(self.x[i], self.lo[i])
-            q = context.geom(self.x[i], self.hi[i])
-            l0 = _LineObject(p, q)
-            l1 = _LineObject((p[0] - l, p[1]), (p[0] + l, p[1]))
-            l2 = _LineObject((q[0] - l, q[1]), (q[0] + l, q[1]))
-            self.add(l0, l1, l2)
+        px, py = context.geom.call_vec(self.x, self.lo)
+        qx, qy = context.geom.call_vec(self.x, self.hi)
+        # the bar and both end caps for each point
+        x0 = _interleave(px, px - l, qx - l)
+        y0 = _interleave(py, py, qy)
+        x1 = _interleave(qx, px + l, qx + l)
+        y1 = _interleave(qy, py, qy)
+        self.add(_SegmentsObject(x0, y0, x1, y1))
 
 
 def SymmetricErrorBarsX(x, y, err, **kw):
@@ -1620,14 +1818,12 @@ class _ErrorLimit(_PlotComponent):
         'type': 'linetype',
     }
 
-    def __init__(self):
+    def __init__(self, **kw):
         # can't do a label for this
         # TODO fix this
 
         label=kw.pop('label',None)
-        super(_ErrorLimits,self).__init__(**kw)
-
-        _PlotComponent.__init__(self)
+        super(_ErrorLimit,self).__init__(**kw)
         self.conf_setattr("_ErrorLimit")
 
 
@@ -1647,13 +1843,13 @@ class UpperLimits(_ErrorLimit):
 
     def make(self, context):
         l = _size_relative(self.size, context.dev_bbox)
-        for i in range(len(self.x)):
-            p = context.geom(self.x[i], self.ulimit[i])
-            l1 = _LineObject((p[0] - l, p[1]), (p[0] + l, p[1]))
-            l2 = _LineObject((p[0], p[1] - 2 * l), (p[0], p[1]))
-            l3 = _LineObject((p[0], p[1] - 2 * l), (p[0] + l, p[1] - l))
-            l4 = _LineObject((p[0], p[1] - 2 * l), (p[0] - l, p[1] - l))
-            self.add(l1, l2, l3, l4)
+        px, py = context.geom.call_vec(self.x, self.ulimit)
+        # the bar, the shaft and the two sides of the arrow head
+        x0 = _interleave(px - l, px, px, px)
+        y0 = _interleave(py, py - 2 * l, py - 2 * l, py - 2 * l)
+        x1 = _interleave(px + l, px, px + l, px - l)
+        y1 = _interleave(py, py, py - l, py - l)
+        self.add(_SegmentsObject(x0, y0, x1, y1))
 
 
 class LowerLimits(_ErrorLimit):
@@ -1672,13 +1868,13 @@ class LowerLimits(_ErrorLimit):
 
     def make(self, context):
         l = _size_relative(self.size, context.dev_bbox)
-        for i in range(len(self.x)):
-            p = context.geom(self.x[i], self.llimit[i])
-            l1 = _LineObject((p[0] - l, p[1]), (p[0] + l, p[1]))
-            l2 = _LineObject((p[0], p[1] + 2 * l), (p[0], p[1]))
-            l3 = _LineObject((p[0], p[1] + 2 * l), (p[0] + l, p[1] + l))
-            l4 = _LineObject((p[0], p[1] + 2 * l), (p[0] - l, p[1] + l))
-            self.add(l1, l2, l3, l4)
+        px, py = context.geom.call_vec(self.x, self.llimit)
+        # the bar, the shaft and the two sides of the arrow head
+        x0 = _interleave(px - l, px, px, px)
+        y0 = _interleave(py, py + 2 * l, py + 2 * l, py + 2 * l)
+        x1 = _interleave(px + l, px, px + l, px - l)
+        y1 = _interleave(py, py, py + l, py + l)
+        self.add(_SegmentsObject(x0, y0, x1, y1))
 
 # Ellipses --------------------------------------------------------------------
 
@@ -1963,16 +2159,16 @@ def _format_ticklabel(x, range=0.):
     return "%g" % x
 
 
+def _format_ticklabels(ticks):
+    range = max(ticks) - min(ticks)
+    return [_format_ticklabel(x, range) for x in ticks]
+
+
 def _ticklist_linear(lo, hi, sep, origin=0.):
-    r = []
     a = _ceil(float(lo - origin) / float(sep))
     b = _floor(float(hi - origin) / float(sep))
-    # for i in range( a, b+1 ):
-    #       r.append( origin + i * sep )
     r0 = origin + a * sep
-    for i in range(b - a + 1):
-        r.append(r0 + i * sep)
-    return r
+    return (r0 + numpy.arange(max(b - a + 1, 0)) * sep).tolist()
 
 
 def _pow10(x):
@@ -2013,21 +2209,15 @@ def _ticks_default_log(lim):
 
 
 def _ticks_num_linear(lim, num):
-    ticks = []
     a = lim[0]
     b = (lim[1] - lim[0]) / float(num - 1)
-    for i in range(num):
-        ticks.append(a + i * b)
-    return ticks
+    return (a + numpy.arange(num) * b).tolist()
 
 
 def _ticks_num_log(lim, num):
-    ticks = []
     a = math.log10(lim[0])
     b = (math.log10(lim[1]) - a) / float(num - 1)
-    for i in range(num):
-        ticks.append(a + i * b)
-    return map(_pow10, ticks)
+    return map(_pow10, (a + numpy.arange(num) * b).tolist())
 
 
 def _subticks_linear(lim, ticks, num=None):
@@ -2052,17 +2242,29 @@ def _subticks_log(lim, ticks, num=None):
     if nn >= 10:
         return map(_pow10, _subticks_linear(log_lim, map(_log10, ticks), num))
     elif nn >= 2:
-        minor_ticks = []
-        for i in range(nlo - 1, nhi + 1):
-            for j in range(1, 10):
-                z = j * _pow10(i)
-                if lim[0] <= z and z <= lim[1]:
-                    minor_ticks.append(z)
-        return minor_ticks
+        decades = map(_pow10, range(nlo - 1, nhi + 1))
+        z = numpy.outer(decades, numpy.arange(1, 10)).ravel()
+        return z[(lim[0] <= z) & (z <= lim[1])].tolist()
     else:
         return _subticks_linear(lim, ticks, num)
 
 
+# ticks and their labels only depend on the axis range and the tick
+# settings, so they are shared across layout passes and frames
+_tick_cache = {}
+
+
+def _tick_memo(key, func, *args):
+    try:
+        return _tick_cache[key]
+    except KeyError:
+        pass
+    if len(_tick_cache) >= 1024:
+        _tick_cache.clear()
+    value = _tick_cache[key] = func(*args)
+    return value
+
+
 class _Group(object):
 
     def __init__(self, objs):
@@ -2103,33 +2305,40 @@ class _HalfAxis(_PlotComponent):
         return self.__dict__[self._attr_map.get(name, name)]
 
     def __setattr__(self, name, value):
-        self.__dict__[self._attr_map.get(name, name)] = value
+        _PlotComponent.__setattr__(self, self._attr_map.get(name, name), value)
 
     def _ticks(self, context):
         log = self._log(context)
-        _range = self._range(context)
+        _range = tuple(self._range(context))
         if self.ticks is None:
-            return self.func_ticks_default[log](_range)
+            func = self.func_ticks_default[log]
+            return _tick_memo(('ticks', func, _range), func, _range)
         elif type(self.ticks) == type(0):
-            return self.func_ticks_num[log](_range, self.ticks)
+            func = self.func_ticks_num[log]
+            return _tick_memo(('ticks', func, _range, self.ticks),
+                              func, _range, self.ticks)
         else:
             return self.ticks
 
     def _subticks(self, context, ticks):
         log = self._log(context)
-        _range = self._range(context)
+        _range = tuple(self._range(context))
         if self.subticks is None:
-            return self.func_subticks_default[log](_range, ticks)
+            func = self.func_subticks_default[log]
+            return _tick_memo(('subticks', func, _range, tuple(ticks)),
+                              func, _range, ticks)
         elif type(self.subticks) == type(0):
-            return self.func_subticks_num[log](
-                _range, ticks, self.subticks)
+            func = self.func_subticks_num[log]
+            return _tick_memo(('subticks', func, _range, tuple(ticks),
+                               self.subticks),
+                              func, _range, ticks, self.subticks)
         else:
             return self.subticks
 
     def _ticklabels(self, context, ticks):
         if self.ticklabels is None:
-            range = [max(ticks) - min(ticks)] * len(ticks)
-            return map(_format_ticklabel, ticks, range)
+            return _tick_memo(('ticklabels', tuple(ticks)),
+                              _format_ticklabels, ticks)
         else:
             return self.ticklabels
 
@@ -2156,6 +2365,14 @@ class _HalfAxis(_PlotComponent):
         l = _LabelsObject(labelpos, labels, **style)
         self.add(l)
 
+    def _grid_style(self):
+        # the grid used to be drawn with LineX/LineY components, so
+        # start from their defaults
+        style = {}
+        style.update(config.value('_LineComponent', 'kw_defaults'))
+        style.update(self.grid_style)
+        return style
+
     def _make_spine(self, context):
         a, b = self._range(context)
         p = self._pos(context, a)
@@ -2173,7 +2390,10 @@ class _HalfAxis(_PlotComponent):
         for tick in ticks:
             tickpos.append(self._pos(context, tick))
 
-        self.add(_CombObject(tickpos, ticklen, **style))
+        x0, y0 = numpy.transpose(tickpos)
+        x1 = x0 + ticklen[0]
+        y1 = y0 + ticklen[1]
+        self.add(_SegmentsObject(x0, y0, x1, y1, **style))
 
     def make(self, context):
         if self.draw_nothing:
@@ -2269,10 +2489,13 @@ class _HalfAxisX(_HalfAxis):
         return context.data_bbox.xrange()
 
     def _make_grid(self, context, ticks):
-        if ticks is None:
+        if ticks is None or not len(ticks) > 0:
             return
-        for tick in ticks:
-            self.add(LineX(tick, **self.grid_style))
+        x = numpy.asarray(ticks, numpy.float64)
+        ymin, ymax = context.data_bbox.yrange()
+        x0, y0 = context.geom.call_vec(x, numpy.zeros_like(x) + ymin)
+        x1, y1 = context.geom.call_vec(x, numpy.zeros_like(x) + ymax)
+        self.add(_SegmentsObject(x0, y0, x1, y1, **self._grid_style()))
 
 
 class _HalfAxisY(_HalfAxis):
@@ -2325,10 +2548,13 @@ class _HalfAxisY(_HalfAxis):
         return context.data_bbox.yrange()
 
     def _make_grid(self, context, ticks):
-        if ticks is None:
+        if ticks is None or not len(ticks) > 0:
             return
-        for tick in ticks:
-            self.add(LineY(tick, **self.grid_style))
+        y = numpy.asarray(ticks, numpy.float64)
+        xmin, xmax = context.data_bbox.xrange()
+        x0, y0 = context.geom.call_vec(numpy.zeros_like(y) + xmin, y)
+        x1, y1 = context.geom.call_vec(numpy.zeros_like(y) + xmax, y)
+        self.add(_SegmentsObject(x0, y0, x1, y1, **self._grid_style()))
 
 # _BoxLabel -------------------------------------------------------------------
 
@@ -2496,6 +2722,51 @@ def win_temp_path():
     return os.getcwd()
 
 
+def _margins(interior, exterior):
+    "Returns the (top, bottom, left, right) overhang of exterior."
+    return (exterior.p1[1] - interior.p1[1],
+            interior.p0[1] - exterior.p0[1],
+            interior.p0[0] - exterior.p0[0],
+            exterior.p1[0] - interior.p1[0])
+
+
+def _solve_interior(region, margins):
+    """
+    Returns the box which, surrounded by margins proportional to its
+    _size_relative yardstick, exactly fills region.  The margins are
+    (top, bottom, left, right) per unit yardstick.  Returns None if
+    there is no such box.
+    """
+    t, b, l, r = margins
+    W = region.width()
+    H = region.height()
+    c = math.sqrt(8)
+    p = l + r
+    q = t + b
+
+    # w = W - p*s, h = H - q*s and s = c*w*h/(w + h), so the
+    # yardstick s is the smaller root of A*s^2 - B*s + C = 0
+    A = c * p * q + p + q
+    B = W + H + c * (W * q + H * p)
+    C = c * W * H
+    disc = B * B - 4 * A * C
+    if disc < 0:
+        return None
+    denom = B + math.sqrt(disc)
+    if denom <= 0:
+        return None
+    s = 2 * C / denom
+
+    w = W - p * s
+    h = H - q * s
+    if w <= 0 or h <= 0:
+        return None
+
+    x0, y0 = region.lowerleft()
+    x0, y0 = x0 + l * s, y0 + b * s
+    return BoundingBox((x0, y0), (x0 + w, y0 + h))
+
+
 class _PlotContainer(_ConfAttributes):
     """
     plot container base class
@@ -2505,6 +2776,10 @@ class _PlotContainer(_ConfAttributes):
     **keywords: optional keywords
     """
 
+    # margins per unit yardstick from the last layout, used as the
+    # starting guess for the next one
+    _layout_margins = None
+
     def __init__(self, **kw):
         self.conf_setattr("_PlotContainer", **kw)
 
@@ -2514,9 +2789,19 @@ class _PlotContainer(_ConfAttributes):
     def interior(self, device, exterior):
         TOL = 0.005
 
-        interior = exterior.copy()
         region_diagonal = exterior.diagonal()
 
+        # The axes, labels, etc. around the interior are all sized
+        # relative to it, so model their margins as proportional to
+        # the interior's yardstick and solve for it directly.  This
+        # is exact unless fontsize_min kicks in, so the loop below
+        # normally measures once or twice.
+        interior = None
+        if self._layout_margins is not None:
+            interior = _solve_interior(exterior, self._layout_margins)
+        if interior is None:
+            interior = exterior.copy()
+
         for i in range(10):
             bb = self.exterior(device, interior)
 
@@ -2526,6 +2811,10 @@ class _PlotContainer(_ConfAttributes):
             sll = pt_len(dll) / region_diagonal
             sur = pt_len(dur) / region_diagonal
 
+            yardstick = _size_relative(100., interior)
+            margins = [m / yardstick for m in _margins(interior, bb)]
+            self._layout_margins = margins
+
             if sll < TOL and sur < TOL:
                 # XXX:fixme
                 if self.aspect_ratio is not None:
@@ -2533,6 +2822,11 @@ class _PlotContainer(_ConfAttributes):
                         self.aspect_ratio)
                 return interior
 
+            solved = _solve_interior(exterior, margins)
+            if solved is not None:
+                interior = solved
+                continue
+
             scale = interior.diagonal() / bb.diagonal()
             dll = pt_mul(scale, dll)
             dur = pt_mul(scale, dur)
@@ -40,6 +40,10 @@ textangle       = 0.0
 texthalign      = center
 textvalign      = center
 
+# threads the native kernels may split large projections, and the levels
+# of large contour plots, over; 0 means one per CPU
+threads         = 1
+
 # --------------------------------------------------
 [screen]
 
@@ -21,7 +21,7 @@
 
 from . import biggles
 from .biggles import \
-    _series, _message, _range, \
+    _series, _message, _range, _thread_bounds, _thread_map, \
     _LineComponent,  _PathObject, _PlotComponent, BigglesError
 from .geometry import *
 from . import _biggles
@@ -33,31 +33,114 @@ def _span(a, b, n):
     return a + float(b - a) * numpy.arange(0, n, 1, numpy.Float) / (n - 1)
 
 
-def _pop2(x, i, j):
-    if i < j:
-        b = x.pop(j)
-        a = x.pop(i)
-    elif i > j:
-        a = x.pop(i)
-        b = x.pop(j)
-    return a, b
+def _split_lines(x, y, line_start, first, last):
+    # lines first up to last of the flat contour_levels arrays
+    lines = []
+    for n in range(first, last):
+        a, b = line_start[n], line_start[n + 1]
+        lines.append((x[a:b], y[a:b]))
+    return lines
 
 
-def _unzip(line):
-    x = []
-    y = []
-    for x0, y0 in line:
-        x.append(x0)
-        y.append(y0)
-    return x, y
+def _block_means(a, n, axis=0):
+    # means of consecutive blocks of n elements along axis; the last
+    # block may be short
+    size = a.shape[axis]
+    start = numpy.arange(0, size, n)
+    count = numpy.diff(numpy.append(start, size))
+    shape = [1] * a.ndim
+    shape[axis] = len(start)
+    return numpy.add.reduceat(a, start, axis=axis) / count.reshape(shape)
 
 
-class Contour(_LineComponent):
+def _resample_grid(x, y, z, nx, ny):
+    """
+    Averages the grid z over blocks of nx by ny points, and the
+    coordinates x and y over the same blocks.
+    """
+    x = numpy.asarray(x, float)
+    y = numpy.asarray(y, float)
+    z = numpy.asarray(z, float)
+    if nx > 1:
+        x = _block_means(x, nx)
+        z = _block_means(z, nx, 0)
+    if ny > 1:
+        y = _block_means(y, ny)
+        z = _block_means(z, ny, 1)
+    return x, y, z
+
+
+def _biggles_arrays(*arrays):
+    # the kernels read float32 and float64 arrays in place, whatever
+    # their strides; anything else is converted once here rather than by
+    # every call
+    native = numpy.dtype(numpy.float32), numpy.dtype(numpy.float64)
+    return [a if isinstance(a, numpy.ndarray) and a.dtype in native
+            else numpy.asarray(a, float) for a in arrays]
+
+
+def _join_levels(results):
+    """
+    Joins the results of contour_levels for consecutive runs of levels
+    into the result for all of them.
+    """
+    if len(results) == 1:
+        return results[0]
+    xs, ys, line_start, level_start = [], [], [0], [0]
+    nbad = 0
+    for x, y, ls, lv, n in results:
+        line_start.extend(ls[1:] + line_start[-1])
+        level_start.extend(lv[1:] + level_start[-1])
+        xs.append(x)
+        ys.append(y)
+        nbad += n
+    return (numpy.concatenate(xs), numpy.concatenate(ys),
+            numpy.array(line_start, numpy.intp),
+            numpy.array(level_start, numpy.intp), nbad)
+
+
+def _data_key(a):
+    # an array is recognised by its buffer, so data changed in place is
+    # only noticed after an invalidate()
+    if isinstance(a, numpy.ndarray):
+        return (id(a), a.__array_interface__['data'][0],
+                a.shape, a.strides, a.dtype.str)
+    return id(a)
+
+
+class _ContourMemo(object):
+
+    # (key, data, lines) of the last contouring, reused until the data
+    # or the levels change
+    _memo = None
+
+    def invalidate(self):
+        """
+        Force the contours to be recomputed on the next draw, e.g. after
+        the data arrays have been modified in place.
+        """
+        self.__dict__['_memo'] = None
+        super(_ContourMemo, self).invalidate()
+
+    def _memoized(self, data, levels, func):
+        key = tuple([_data_key(a) for a in data]) + (levels,)
+        memo = self._memo
+        if memo is None or memo[0] != key:
+            # keeping data keeps the ids in the key from being reused
+            memo = key, data, func()
+            self.__dict__['_memo'] = memo
+        return memo[2]
+
+
+class Contour(_ContourMemo, _LineComponent):
     """
     Object representing a contour
     TODO document args
     """
 
+    # lines already computed by Contours, which does all its levels at once
+    _lines = None
+
     def __init__(self, x, y, z, z0, **kw):
         _LineComponent.__init__(self)
         self.kw_init(kw)
@@ -72,64 +155,21 @@ class Contour(_LineComponent):
         return BoundingBox(p, q)
 
     def _get_contours(self):
-        segs = _biggles.contour_segments(
-            self.x, self.y, self.z, self.z0)
-        open = [[segs[0][0], segs[0][1]]]
-        closed = []
-        for a, b in segs[1:]:
-            xxx = []
-            for i in range(len(open)):
-                begin = open[i][0]
-                end = open[i][-1]
-                if a == begin:
-                    xxx.append((i, 0, b))
-                elif a == end:
-                    xxx.append((i, 1, b))
-                if b == begin:
-                    xxx.append((i, 0, a))
-                elif b == end:
-                    xxx.append((i, 1, a))
-            if len(xxx) == 0:
-                open.append([a, b])
-            elif len(xxx) == 1:
-                i, end, pt = xxx[0]
-                if end == 0:
-                    open[i].insert(0, pt)
-                else:
-                    open[i].append(pt)
-            elif len(xxx) == 2:
-                i0, end0, pt0 = xxx[0]
-                i1, end1, pt1 = xxx[1]
-                if i0 == i1:
-                    # closed
-                    l0 = open.pop(i0)
-                    l0.append(l0[0])
-                    closed.append(l0)
-                else:
-                    l0, l1 = _pop2(open, i0, i1)
-                    m = None
-                    if end0 == 1 and end1 == 0:
-                        m = l0 + l1
-                    elif end0 == 0 and end1 == 1:
-                        m = l1 + l0
-                    elif end0 == 0 and end1 == 0:
-                        l0.reverse()
-                        m = l0 + l1
-                    elif end0 == 1 and end1 == 1:
-                        l1.reverse()
-                        m = l0 + l1
-                    if m is not None:
-                        open.append(m)
-                    else:
-                        _message("contour: m is None")
-            elif len(xxx) > 2:
-                _message("contour: len(xxx) > 2")
-        return open + closed
+        if self._lines is not None:
+            return self._lines
+        return self._memoized((self.x, self.y, self.z), self.z0,
+                              self._contour)
+
+    def _contour(self):
+        lines, nbad = _biggles.contour_lines(self.x, self.y, self.z, self.z0)
+        if nbad > 0:
+            _message("contour: %d segments touch more than two line ends"
+                     % nbad)
+        return lines
 
     def make(self, context):
         lines = self._get_contours()
-        for line in lines:
-            x, y = _unzip(line)
+        for x, y in lines:
             u, v = context.geom.call_vec(x, y)
             self.add(_PathObject(u, v))
 
@@ -148,7 +188,7 @@ def _func_linewidth_placeholder(i, n, z0, z_min, z_max):
     return 1
 
 
-class Contours(_PlotComponent):
+class Contours(_ContourMemo, _PlotComponent):
     """
     Create a 2-d contour plot object
 
@@ -162,6 +202,16 @@ class Contours(_PlotComponent):
             y values along the row direction
     zrange: optional
             ?? what is this?
+    resample: bool
+        If True, contour the grid averaged down to about one point per
+        device unit (pixel) when it has many more points than that, so
+        the drawing cost follows the output resolution rather than the
+        size of the grid.  Default False.
+
+    The levels are split over the threads set by the threads option in
+    the [default] config section, each level being traced over the
+    whole grid by one thread, so more threads only help with more than
+    one level.
 
     **keywords
             Style and other keywords for the Contours.
@@ -182,7 +232,7 @@ class Contours(_PlotComponent):
         "placeholder": _func_linewidth_placeholder,
     }
 
-    def __init__(self, z, x=None, y=None, zrange=None, **kw):
+    def __init__(self, z, x=None, y=None, zrange=None, resample=False, **kw):
         super(Contours, self).__init__()
         #apply( self.conf_setattr, ("Contours",), kw )
         self.conf_setattr("Contours")
@@ -191,6 +241,7 @@ class Contours(_PlotComponent):
         self.x = x
         self.y = y
         self.zrange = zrange
+        self.resample = resample
 
     def _get_coords(self):
         dim = self.z.shape
@@ -235,6 +286,14 @@ class Contours(_PlotComponent):
         if type(widthfunc) == type(""):
             widthfunc = self._named_func_linewidth[widthfunc]
 
+        blocks = 1, 1
+        if self.resample:
+            blocks = self._resample_blocks(context, x, y)
+
+        xs, ys, line_start, level_start = self._memoized(
+            (self.x, self.y, self.z), (tuple(levels), blocks),
+            lambda: self._contour_levels(x, y, z, levels, blocks))
+
         nlevels = len(levels)
         for i in range(nlevels):
             kw = {}
@@ -257,8 +316,34 @@ class Contours(_PlotComponent):
                     kw["linewidth"] = linewidth
             c = Contour(x, y, z, z0, **kw)
             #c = apply( Contour, (x, y, z, z0), kw )
+            c._lines = _split_lines(xs, ys, line_start,
+                                    level_start[i], level_start[i + 1])
             self.add(c)
 
+    def _resample_blocks(self, context, x, y):
+        # the number of grid points per device unit, along x and along y
+        u, v = context.geom.call_vec([x[0], x[-1], x[0]], [y[0], y[0], y[-1]])
+        width = max(abs(u[1] - u[0]), 1.)
+        height = max(abs(v[2] - v[0]), 1.)
+        return (max(int(len(x) / width), 1),
+                max(int(len(y) / height), 1))
+
+    def _contour_levels(self, x, y, z, levels, blocks):
+        if blocks != (1, 1):
+            x, y, z = _resample_grid(x, y, z, *blocks)
+        x, y, z = _biggles_arrays(x, y, z)
+        # each thread contours a run of the levels over the whole grid;
+        # a single level is never split
+        bounds = _thread_bounds(len(levels), z.size)
+        args = [(x, y, z, levels[i:j])
+                for i, j in zip(bounds[:-1], bounds[1:])]
+        xs, ys, line_start, level_start, nbad = \
+            _join_levels(_thread_map(_biggles.contour_levels, args))
+        if nbad > 0:
+            _message("contour: %d segments touch more than two line ends"
+                     % nbad)
+        return xs, ys, line_start, level_start
+
     def make_key(self, bbox):
         xr = bbox.xrange()
         y = bbox.center()[1]
@@ -30,21 +30,44 @@
 #
 from __future__ import print_function
 import math
+import numpy
 from biggles import \
-    _series, _PlotComposite, _PlotGeometry, _PlotContainer, Geodesic, Curve
+    _series, _PlotComposite, _PlotGeometry, _PlotContainer, Geodesic, Curve, \
+    _LineComponent, _PathObject, _PlotComponent, _DensityObject, \
+    _thread_bounds, _thread_map
 from geometry import *
 from . import _biggles
 
 
 class _HammerAitoffGeometry(object):
 
-    def __init__(self, dest, l0=0., b0=0, rot=0.):
+    def __init__(self, dest, l0=0., b0=0, rot=0., memo=None, extent=None):
         self.src_bbox = BoundingBox((-1., -.5), (1., .5))
         self.dest_bbox = dest
         self.aff = RectilinearMap(self.src_bbox, dest)
+        # geodesics are made fine enough for any view inside extent
+        if extent is None:
+            extent = dest
+        self.extent = extent
         self.l0 = l0
         self.b0 = b0
         self.rot = rot
+        # projections in Hammer coordinates, which don't depend on dest,
+        # keyed on the ids of the arrays they were made from
+        self.memo = memo
+
+    def _memoized(self, key, args, func, *params):
+        if self.memo is None:
+            return func(*(args + params))
+        key = (key, params) + tuple(map(id, args))
+        try:
+            return self.memo[key][1]
+        except KeyError:
+            pass
+        # keeping args keeps the ids in the key from being reused
+        value = func(*(args + params))
+        self.memo[key] = args, value
+        return value
 
     def __call__(self, l_, b_):
         xh, yh = _biggles.hammer_call(
@@ -52,36 +75,213 @@ class _HammerAitoffGeometry(object):
         return self.aff(xh, yh)
 
     def call_vec(self, l_, b_):
-        xh, yh = _biggles.hammer_call_vec(
-            l_, b_, self.l0, self.b0, self.rot)
+        xh, yh = self._memoized('call_vec', (l_, b_), self._hammer_vec)
         return self.aff.call_vec(xh, yh)
 
-    def geodesic(self, l_, b_, div=2):
-        l, b = _biggles.hammer_geodesic_fill(l_, b_, div)
+    def _hammer_vec(self, l_, b_):
+        l_ = numpy.asarray(l_)
+        b_ = numpy.asarray(b_)
+        bounds = _thread_bounds(min(len(l_), len(b_)))
+        if len(bounds) == 2:
+            return _biggles.hammer_call_vec(
+                l_, b_, self.l0, self.b0, self.rot)
+        args = [(l_[i:j], b_[i:j], self.l0, self.b0, self.rot)
+                for i, j in zip(bounds[:-1], bounds[1:])]
+        uv = _thread_map(_biggles.hammer_call_vec, args)
+        return (numpy.concatenate([u for u, v in uv]),
+                numpy.concatenate([v for u, v in uv]))
+
+    # largest distance, in device units, between a geodesic and the
+    # chords it is drawn with
+    tolerance = 0.25
+
+    def _hammer_tolerance(self):
+        # the tolerance in Hammer units, rounded down to a power of two
+        # so that views of about the same size share geodesics
+        ext = self.extent
+        scale = max(abs(ext.width()) / 2., abs(ext.height()), 1e-12)
+        return 2. ** math.floor(math.log(self.tolerance / scale, 2))
+
+    def geodesic(self, l_, b_, div=None):
+        """
+        Joins the points by great circles, split where they wrap around
+        the edge of the map. Each step gets div points or, by default,
+        just enough to stay within tolerance of the true curve.
+        """
+        if div is None:
+            params = None, self._hammer_tolerance()
+        else:
+            params = div, None
+        return self._memoized('geodesic', (l_, b_), self._geodesic, *params)
+
+    def _geodesic(self, l_, b_, div, tol):
+        l_ = numpy.asarray(l_)
+        b_ = numpy.asarray(b_)
+        if len(l_) != len(b_):
+            raise ValueError("l and b have different lengths")
+        # neighbouring pieces share a point, which only the first keeps
+        bounds = _thread_bounds(len(l_), div or 4)
+        args = [(l_[i:j + 1], b_[i:j + 1], div, tol)
+                for i, j in zip(bounds[:-1], bounds[1:])]
+        pieces = _thread_map(self._geodesic_fill, args)
+        l = numpy.concatenate([pieces[0][0]] + [p[0][1:] for p in pieces[1:]])
+        b = numpy.concatenate([pieces[0][1]] + [p[1][1:] for p in pieces[1:]])
+        breaks = _biggles.hammer_breaks(l, b, self.l0, self.b0, self.rot)
         segs = []
         i0 = 0
-        for i in range(1, len(l)):
-            if _biggles.hammer_connect(
-                    l[i - 1], b[i - 1], l[i], b[i],
-                    self.l0, self.b0, self.rot):
-                segs.append((l[i0:i], b[i0:i]))
-                i0 = i
+        for i in breaks:
+            segs.append((l[i0:i], b[i0:i]))
+            i0 = i
         segs.append((l[i0:], b[i0:]))
         return segs
 
+    def _geodesic_fill(self, l_, b_, div, tol):
+        if div is None:
+            return _biggles.hammer_geodesic_adaptive(
+                l_, b_, self.l0, self.b0, self.rot, tol)
+        return _biggles.hammer_geodesic_fill(l_, b_, div)
+
+
+# ribs of the background grid in Hammer coordinates, by view and number
+_graticule_cache = {}
+
+
+def _graticule(l0, b0, rot, ribs_l, ribs_b):
+    key = l0, b0, rot, ribs_l, ribs_b
+    try:
+        return _graticule_cache[key]
+    except KeyError:
+        pass
+
+    ribs = []
+    b = _series(-90 // 2, 90 // 2, 2 * math.pi / 180.)
+    for l in _series(-ribs_l, ribs_l, math.pi / ribs_l):
+        ribs.append(([l] * len(b), b))
+    l = _series(-180 // 2, 180 // 2, 2 * math.pi / 180.)
+    for b in _series(-ribs_b, ribs_b, 0.5 * math.pi / (ribs_b + 1)):
+        ribs.append((l, [b] * len(l)))
+
+    geom = _HammerAitoffGeometry(BoundingBox((-1., -.5), (1., .5)),
+                                 l0, b0, rot)
+    # these paths are shared by plots of every size, so a fixed fill
+    paths = []
+    for l, b in ribs:
+        for seg in geom.geodesic(l, b, 2):
+            paths.append(geom._hammer_vec(seg[0], seg[1]))
+
+    if len(_graticule_cache) >= 64:
+        _graticule_cache.clear()
+    _graticule_cache[key] = paths
+    return paths
+
+
+class _Graticule(_LineComponent):
+
+    def __init__(self, paths, **kw):
+        super(_Graticule, self).__init__(**kw)
+        self.kw_init(kw)
+        self.paths = paths
+
+    def make(self, context):
+        for xh, yh in self.paths:
+            u, v = context.geom.aff.call_vec(xh, yh)
+            self.add(_PathObject(u, v))
+
 
 class _HammerAitoffContext(object):
 
-    def __init__(self, device, dev, l0=0., b0=0., rot=0.):
+    def __init__(self, device, dev, l0=0., b0=0., rot=0., memo=None,
+                 extent=None):
         self.draw = device
         self.dev_bbox = dev
-        self.geom = _HammerAitoffGeometry(dev, l0, b0, rot)
+        self.geom = _HammerAitoffGeometry(dev, l0, b0, rot, memo, extent)
         self.plot_geom = _PlotGeometry(BoundingBox((0, 0), (1, 1)), dev)
 
+    def cache_key(self):
+        geom = self.geom
+        return (getattr(self.draw, 'page_id', None),
+                self.dev_bbox.p0, self.dev_bbox.p1,
+                geom.l0, geom.b0, geom.rot)
+
     def do_clip(self):
         pass
 
 
+class SkyDensity(_PlotComponent):
+    """
+    A density map of positions on the sky, for a HammerAitoffPlot.
+
+    The positions are counted in bins uniform in l and in sin(b), which
+    all cover the same area of sky.  The map is drawn as one raster at
+    the output resolution, each cell showing the bin its centre projects
+    back to, so the drawing cost doesn't depend on the number of
+    positions.
+
+    parameters
+    ----------
+    l, b: arrays, optional
+        Positions to count, in radians.  More can be counted later with
+        add_points().
+    nl, nb: int, optional
+        The number of bins in l and in b.  Default 360, 180.
+    zrange: optional
+        The counts drawn black and white, (low, high).  Default from
+        zero to the largest count.
+    chunksize: int, optional
+        The positions are converted and counted this many at a time,
+        so arrays larger than memory, e.g. a numpy.memmap, can be
+        counted.  Default 1048576.
+
+    **keywords
+            Style and other keywords for the SkyDensity.
+    """
+
+    def __init__(self, l=None, b=None, nl=360, nb=180, zrange=None,
+                 chunksize=1048576, **kw):
+        super(SkyDensity, self).__init__(**kw)
+        self.conf_setattr("SkyDensity")
+        self.kw_init(kw)
+        self.counts = numpy.zeros((nl, nb))
+        self.zrange = zrange
+        self.chunksize = chunksize
+        if l is not None:
+            self.add_points(l, b)
+
+    def add_points(self, l, b):
+        """
+        Count more positions (l, b), in radians.
+        """
+        n = len(l)
+        if len(b) != n:
+            raise ValueError("l[%d] size differs from b[%d]" % (n, len(b)))
+        step = self.chunksize
+        for i in range(0, n, step):
+            _biggles.sky_bin(l[i:i + step], b[i:i + step], self.counts)
+        self.invalidate()
+
+    def make(self, context):
+        geom = context.geom
+        bb = geom.dest_bbox
+        nx = max(int(math.ceil(abs(bb.width()))), 1)
+        ny = max(int(math.ceil(abs(bb.height()))), 1)
+        raster = _biggles.hammer_sky_raster(
+            self.counts, nx, ny, geom.l0, geom.b0, geom.rot)
+
+        zr = self.zrange
+        if zr is None:
+            zr = 0., self.counts.max()
+        scale = zr[1] - zr[0]
+        if scale == 0:
+            scale = 1.
+        raster = (raster - zr[0]) / scale
+        # NaN, outside the map, stays NaN and isn't drawn
+        numpy.clip(raster, 0., 1., raster)
+
+        p = geom.aff(-1., -.5)
+        q = geom.aff(1., .5)
+        self.add(_DensityObject(raster, (p, q)))
+
+
 class HammerAitoffPlot(_PlotContainer):
 
     _attr_deprecated = {
@@ -122,34 +322,38 @@ class HammerAitoffPlot(_PlotContainer):
         return self
 
     def _draw_background(self, context):
+        paths = _graticule(self.l0, self.b0, self.rot,
+                           self.ribs_l, self.ribs_b)
         pc = _PlotComposite()
+        pc.add(_Graticule(paths, **self.ribs_style))
+        pc.render(context)
 
-        nl = self.ribs_l
-        b = _series(-90 // 2, 90 // 2, 2 * math.pi / 180.)
-        for l0 in _series(-nl, nl, math.pi / nl):
-            c = Curve([l0] * len(b), b, **self.ribs_style)
-            #c = apply( Curve, ([l0]*len(b), b), self.ribs_style )
-            pc.add(c)
-
-        nb = self.ribs_b
-        l = _series(-180 // 2, 180 // 2, 2 * math.pi / 180.)
-        for b0 in _series(-nb, nb, 0.5 * math.pi / (nb + 1)):
-            c = Curve(l, [b0] * len(l), **self.ribs_style)
-            #c = apply( Curve, (l, [b0]*len(l)), self.ribs_style )
-            pc.add(c)
+    def _context(self, device, interior):
+        return _HammerAitoffContext(device, interior,
+                                    self.l0, self.b0, self.rot,
+                                    self.__dict__.get('_projections'),
+                                    self.__dict__.get('_extent'))
 
-        pc.render(context)
+    def compose(self, device, region):
+        # the layout passes and the final drawing share one projection
+        # of the content, made for the whole region so that it is fine
+        # enough for each of their interiors
+        self.__dict__['_projections'] = {}
+        self.__dict__['_extent'] = region
+        try:
+            _PlotContainer.compose(self, device, region)
+        finally:
+            self.__dict__['_projections'] = None
+            self.__dict__['_extent'] = None
 
     def exterior(self, device, interior):
         bb = interior.copy()
-        context = _HammerAitoffContext(device, interior,
-                                       self.l0, self.b0, self.rot)
+        context = self._context(device, interior)
         bb.union(self.content.bbox(context))
         return bb
 
     def compose_interior(self, device, interior):
         _PlotContainer.compose_interior(self, device, interior)
-        context = _HammerAitoffContext(device, interior,
-                                       self.l0, self.b0, self.rot)
+        context = self._context(device, interior)
         self._draw_background(context)
         self.content.render(context)
@@ -34,16 +34,7 @@ typedef int bool_t;
 #define M_PI 3.14159265358979323846
 #endif
 
-#define BGL_DArray1(v,i)\
-	(*(double *)PyArray_GETPTR1(v,i))
-
-#define BGL_DArray2(v,i,j)\
-	(*(double *)PyArray_GETPTR2(v,i,j))
-
-#define BGL_DArray3(v,i,j,k)\
-	(*(double *)PyArray_GETPTR3(v,i,j,k))
-
-
+#include "../_bgl_array.h"
 
 #define BGL_MIN(a,b) (((a) < (b)) ? (a) : (b))
 #define BGL_MAX(a,b) (((a) > (b)) ? (a) : (b))
@@ -370,6 +361,7 @@ BGL_PL_FUNC( end_page, pl_closepl_r )
 BGL_PL_FUNC( flush, pl_flushpl_r )
 BGL_PL_FUNC( gsave, pl_savestate_r )
 BGL_PL_FUNC( grestore, pl_restorestate_r )
+BGL_PL_FUNC( endpath, pl_endpath_r )
 //BGL_PL_FUNC( begin_page, pl_openpl_r )
 
 
@@ -650,8 +642,8 @@ symbols(struct PyLibPlot *self, PyObject *args)
 	if ( !PyArg_ParseTuple( args, "OOid", &ox, &oy, &i0, &d0 ) )
 		return NULL;
 
-	x = PyArray_ContiguousFromAny( ox, NPY_DOUBLE, 1, 1 );
-	y = PyArray_ContiguousFromAny( oy, NPY_DOUBLE, 1, 1 );
+	x = _bgl_array( ox, 1 );
+	y = _bgl_array( oy, 1 );
 
 	if ( x == NULL || y == NULL )
 		goto quit;
@@ -661,7 +653,7 @@ symbols(struct PyLibPlot *self, PyObject *args)
 	_symbol_begin( self->pl, i0, d0 );
 
 	for ( i = 0; i < n; i++ )
-		_symbol_draw( self->pl, BGL_DArray1(x,i), BGL_DArray1(y,i), i0, d0 );
+		_symbol_draw( self->pl, BGL_Array1(x,i), BGL_Array1(y,i), i0, d0 );
 
 	_symbol_end( self->pl, i0, d0 );
 
@@ -686,8 +678,8 @@ clipped_symbols(struct PyLibPlot *self, PyObject *args)
 			&i0, &d0, &xmin, &xmax, &ymin, &ymax ) )
 		return NULL;
 
-	x = PyArray_ContiguousFromAny( ox, NPY_DOUBLE, 1, 1 );
-	y = PyArray_ContiguousFromAny( oy, NPY_DOUBLE, 1, 1 );
+	x = _bgl_array( ox, 1 );
+	y = _bgl_array( oy, 1 );
 
 	if ( x == NULL || y == NULL )
 		goto quit;
@@ -698,8 +690,8 @@ clipped_symbols(struct PyLibPlot *self, PyObject *args)
 
 	for ( i = 0; i < n; i++ )
 	{
-		px = BGL_DArray1(x,i);
-		py = BGL_DArray1(y,i);
+		px = BGL_Array1(x,i);
+		py = BGL_Array1(y,i);
 
 		if ( px >= xmin && px <= xmax &&
 		     py >= ymin && py <= ymax )
@@ -714,6 +706,69 @@ quit:
     Py_RETURN_NONE;
 }
 
+/* sets the pen and fill to color i of c, unless they're already set */
+static void
+_symbol_color( plPlotter *pl, PyObject *c, npy_intp i, int rgb[3] )
+{
+	int r, g, b;
+
+	r = (int) floor( BGL_Array2(c,i,0)*65535 );
+	g = (int) floor( BGL_Array2(c,i,1)*65535 );
+	b = (int) floor( BGL_Array2(c,i,2)*65535 );
+
+	if ( r != rgb[0] || g != rgb[1] || b != rgb[2] )
+	{
+		pl_fillcolor_r( pl, r, g, b );
+		pl_pencolor_r(  pl, r, g, b );
+		rgb[0] = r;
+		rgb[1] = g;
+		rgb[2] = b;
+	}
+}
+
+static PyObject *
+colored_symbols(struct PyLibPlot *self, PyObject *args)
+{
+	PyObject *ox, *oy, *oc;
+	PyObject *x, *y, *c;
+	double d0;
+	int i0;
+	npy_intp i, n;
+	int rgb[3] = { -1, -1, -1 };
+
+	if ( !PyArg_ParseTuple( args, "OOOid", &ox, &oy, &oc, &i0, &d0 ) )
+		return NULL;
+
+	x = _bgl_array( ox, 1 );
+	y = _bgl_array( oy, 1 );
+	c = _bgl_array( oc, 2 );
+
+	if ( x == NULL || y == NULL || c == NULL )
+		goto quit;
+
+	n = BGL_MIN( PyArray_SIZE(x), PyArray_SIZE(y) );
+	n = BGL_MIN( n, PyArray_DIM(c,0) );
+
+	_symbol_begin( self->pl, i0, d0 );
+
+	for ( i = 0; i < n; i++ )
+	{
+		_symbol_color( self->pl, c, i, rgb );
+		_symbol_draw( self->pl,
+			BGL_Array1(x,i), BGL_Array1(y,i), i0, d0 );
+	}
+
+	_symbol_end( self->pl, i0, d0 );
+
+quit:
+	Py_XDECREF(x);
+	Py_XDECREF(y);
+	Py_XDECREF(c);
+	if ( PyErr_Occurred() )
+		return NULL;
+    Py_RETURN_NONE;
+}
+
 static PyObject *
 clipped_colored_symbols(struct PyLibPlot *self, PyObject *args)
 {
@@ -724,37 +779,32 @@ clipped_colored_symbols(struct PyLibPlot *self, PyObject *args)
 	int i0;
     npy_intp i, n;
 	double px, py;
-	int r, g, b;
+	int rgb[3] = { -1, -1, -1 };
 
 	if ( !PyArg_ParseTuple( args, "OOOiddddd", &ox, &oy, &oc,
 			&i0, &d0, &xmin, &xmax, &ymin, &ymax ) )
 		return NULL;
 
-	x = PyArray_ContiguousFromAny( ox, NPY_DOUBLE, 1, 1 );
-	y = PyArray_ContiguousFromAny( oy, NPY_DOUBLE, 1, 1 );
-	c = PyArray_ContiguousFromAny( oc, NPY_DOUBLE, 2, 2 );
+	x = _bgl_array( ox, 1 );
+	y = _bgl_array( oy, 1 );
+	c = _bgl_array( oc, 2 );
 
 	if ( x == NULL || y == NULL || c == NULL )
 		goto quit;
 
 	n = BGL_MIN( PyArray_SIZE(x), PyArray_SIZE(y) );
-	n = BGL_MIN( n, PyArray_SIZE(c) );
+	n = BGL_MIN( n, PyArray_DIM(c,0) );
 	
 	_symbol_begin( self->pl, i0, d0 );
 
 	for ( i = 0; i < n; i++ )
 	{
-		px = BGL_DArray1(x,i);
-		py = BGL_DArray1(y,i);
+		px = BGL_Array1(x,i);
+		py = BGL_Array1(y,i);
 
 		if ( px >= xmin && px <= xmax &&
 		     py >= ymin && py <= ymax ) {
-			r = (int) floor( BGL_DArray2(c,i,0)*65535 );
-			g = (int) floor( BGL_DArray2(c,i,1)*65535 );
-			b = (int) floor( BGL_DArray2(c,i,2)*65535 );
-			pl_fillcolor_r( self->pl, r, g, b );
-			pl_pencolor_r(  self->pl, r, g, b );
-		  
+			_symbol_color( self->pl, c, i, rgb );
 			_symbol_draw( self->pl, px, py, i0, d0 );
 		}
 	}
@@ -765,6 +815,8 @@ quit:
 	Py_XDECREF(x);
 	Py_XDECREF(y);
 	Py_XDECREF(c);
+	if ( PyErr_Occurred() )
+		return NULL;
     Py_RETURN_NONE;
 }
 
@@ -780,8 +832,8 @@ curve(struct PyLibPlot *self, PyObject *args)
 	if ( !PyArg_ParseTuple( args, "OO", &ox, &oy ) )
 		return NULL;
 
-	x = PyArray_ContiguousFromAny( ox, NPY_DOUBLE, 1, 1 );
-	y = PyArray_ContiguousFromAny( oy, NPY_DOUBLE, 1, 1 );
+	x = _bgl_array( ox, 1 );
+	y = _bgl_array( oy, 1 );
 
 	if ( x == NULL || y == NULL )
 		goto quit;
@@ -790,9 +842,9 @@ curve(struct PyLibPlot *self, PyObject *args)
 	if ( n <= 0 )
 		goto quit;
 
-	pl_fmove_r( self->pl, BGL_DArray1(x,0), BGL_DArray1(y,0) );
+	pl_fmove_r( self->pl, BGL_Array1(x,0), BGL_Array1(y,0) );
 	for ( i = 1; i < n; i++ )
-		pl_fcont_r( self->pl, BGL_DArray1(x,i), BGL_DArray1(y,i) );
+		pl_fcont_r( self->pl, BGL_Array1(x,i), BGL_Array1(y,i) );
 	pl_endpath_r( self->pl );
 
 quit:
@@ -813,8 +865,8 @@ clipped_curve(struct PyLibPlot *self, PyObject *args)
 			&xmin, &xmax, &ymin, &ymax ) )
 		return NULL;
 
-	x = PyArray_ContiguousFromAny( ox, NPY_DOUBLE, 1, 1 );
-	y = PyArray_ContiguousFromAny( oy, NPY_DOUBLE, 1, 1 );
+	x = _bgl_array( ox, 1 );
+	y = _bgl_array( oy, 1 );
 
 	if ( x == NULL || y == NULL )
 		goto quit;
@@ -827,8 +879,8 @@ clipped_curve(struct PyLibPlot *self, PyObject *args)
 	{
 		clipped_pl_fline_r( self->pl,
 			xmin, xmax, ymin, ymax,
-			BGL_DArray1(x,i), BGL_DArray1(y,i),
-			BGL_DArray1(x,i+1), BGL_DArray1(y,i+1) );
+			BGL_Array1(x,i), BGL_Array1(y,i),
+			BGL_Array1(x,i+1), BGL_Array1(y,i+1) );
 	}
 	pl_endpath_r( self->pl );
 
@@ -839,29 +891,448 @@ quit:
 }
 
 
+/*
+ * Draw a set of unconnected line segments, from (x0[i], y0[i]) to
+ * (x1[i], y1[i]).
+ */
+
+static PyObject *
+segments(struct PyLibPlot *self, PyObject *args)
+{
+	PyObject *ox0, *oy0, *ox1, *oy1;
+	PyObject *x0, *y0, *x1, *y1;
+	npy_intp i, n;
+
+	if ( !PyArg_ParseTuple( args, "OOOO", &ox0, &oy0, &ox1, &oy1 ) )
+		return NULL;
+
+	x0 = _bgl_array( ox0, 1 );
+	y0 = _bgl_array( oy0, 1 );
+	x1 = _bgl_array( ox1, 1 );
+	y1 = _bgl_array( oy1, 1 );
+
+	if ( x0 == NULL || y0 == NULL || x1 == NULL || y1 == NULL )
+		goto quit;
+
+	n = BGL_MIN( BGL_MIN( PyArray_SIZE(x0), PyArray_SIZE(y0) ),
+		BGL_MIN( PyArray_SIZE(x1), PyArray_SIZE(y1) ) );
+	if ( n <= 0 )
+		goto quit;
+
+	for ( i = 0; i < n; i++ )
+	{
+		pl_fline_r( self->pl,
+			BGL_Array1(x0,i), BGL_Array1(y0,i),
+			BGL_Array1(x1,i), BGL_Array1(y1,i) );
+	}
+	pl_endpath_r( self->pl );
+
+quit:
+	Py_XDECREF(x0);
+	Py_XDECREF(y0);
+	Py_XDECREF(x1);
+	Py_XDECREF(y1);
+	if ( PyErr_Occurred() )
+		return NULL;
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+clipped_segments(struct PyLibPlot *self, PyObject *args)
+{
+	PyObject *ox0, *oy0, *ox1, *oy1;
+	PyObject *x0, *y0, *x1, *y1;
+	double xmin, xmax, ymin, ymax;
+	npy_intp i, n;
+
+	if ( !PyArg_ParseTuple( args, "OOOOdddd", &ox0, &oy0, &ox1, &oy1,
+			&xmin, &xmax, &ymin, &ymax ) )
+		return NULL;
+
+	x0 = _bgl_array( ox0, 1 );
+	y0 = _bgl_array( oy0, 1 );
+	x1 = _bgl_array( ox1, 1 );
+	y1 = _bgl_array( oy1, 1 );
+
+	if ( x0 == NULL || y0 == NULL || x1 == NULL || y1 == NULL )
+		goto quit;
+
+	n = BGL_MIN( BGL_MIN( PyArray_SIZE(x0), PyArray_SIZE(y0) ),
+		BGL_MIN( PyArray_SIZE(x1), PyArray_SIZE(y1) ) );
+	if ( n <= 0 )
+		goto quit;
+
+	for ( i = 0; i < n; i++ )
+	{
+		clipped_pl_fline_r( self->pl,
+			xmin, xmax, ymin, ymax,
+			BGL_Array1(x0,i), BGL_Array1(y0,i),
+			BGL_Array1(x1,i), BGL_Array1(y1,i) );
+	}
+	pl_endpath_r( self->pl );
+
+quit:
+	Py_XDECREF(x0);
+	Py_XDECREF(y0);
+	Py_XDECREF(x1);
+	Py_XDECREF(y1);
+	if ( PyErr_Occurred() )
+		return NULL;
+    Py_RETURN_NONE;
+}
+
+/*
+ * Polygons --
+ *   The clipped version runs Sutherland-Hodgman against each edge
+ *   of the clip rectangle in turn.
+ */
+
+static void
+_polygon_draw( plPlotter *pl, const double *x, const double *y, npy_intp n )
+{
+	npy_intp i;
+
+	if ( n <= 0 )
+		return;
+
+	pl_fmove_r( pl, x[0], y[0] );
+	for ( i = 1; i < n; i++ )
+		pl_fcont_r( pl, x[i], y[i] );
+	pl_endpath_r( pl );
+}
+
+/* clips against one edge; ox, oy must have room for 2*n points */
+static npy_intp
+_polygon_clip_edge( const double *x, const double *y, npy_intp n,
+	int dim, double boundary, int side, double *ox, double *oy )
+{
+	const double *p = (dim == 0) ? x : y;
+	const double *q = (dim == 0) ? y : x;
+	double *op = (dim == 0) ? ox : oy;
+	double *oq = (dim == 0) ? oy : ox;
+	npy_intp i, j, m = 0;
+	bool_t p_inside, s_inside;
+	double g;
+
+	if ( n <= 0 )
+		return 0;
+
+	j = n - 1;
+	s_inside = side*p[j] >= side*boundary;
+	for ( i = 0; i < n; i++ )
+	{
+		p_inside = side*p[i] >= side*boundary;
+
+		if ( p_inside != s_inside )
+		{
+			g = (boundary - p[j]) / (p[i] - p[j]);
+			op[m] = boundary;
+			oq[m] = q[j] + g*(q[i] - q[j]);
+			m++;
+		}
+
+		if ( p_inside )
+		{
+			op[m] = p[i];
+			oq[m] = q[i];
+			m++;
+		}
+
+		j = i;
+		s_inside = p_inside;
+	}
+
+	return m;
+}
+
+static PyObject *
+polygon(struct PyLibPlot *self, PyObject *args)
+{
+	PyObject *ox, *oy;
+	PyObject *x, *y;
+	npy_intp n;
+
+	if ( !PyArg_ParseTuple( args, "OO", &ox, &oy ) )
+		return NULL;
+
+	x = PyArray_ContiguousFromAny( ox, NPY_DOUBLE, 1, 1 );
+	y = PyArray_ContiguousFromAny( oy, NPY_DOUBLE, 1, 1 );
+
+	if ( x == NULL || y == NULL )
+		goto quit;
+
+	n = BGL_MIN( PyArray_SIZE(x), PyArray_SIZE(y) );
+	_polygon_draw( self->pl, (double *)PyArray_DATA(x),
+		(double *)PyArray_DATA(y), n );
+
+quit:
+	Py_XDECREF(x);
+	Py_XDECREF(y);
+	if ( PyErr_Occurred() )
+		return NULL;
+    Py_RETURN_NONE;
+}
+
+/*
+ *  Clips the polygon against each edge of bounds (xmin, xmax, ymin,
+ *  ymax) in turn. The result is left in *px, *py, which point into
+ *  buf[0] or buf[1]; the caller frees both. Returns the number of
+ *  points, or -1 if out of memory.
+ */
+static npy_intp
+_polygon_clip( const double *x, const double *y, npy_intp n,
+	const double bounds[4], double *buf[2],
+	const double **px, const double **py )
+{
+	double *tmp;
+	npy_intp cap;
+	int k;
+
+	*px = x;
+	*py = y;
+	for ( k = 0; k < 4 && n > 0; k++ )
+	{
+		/* each edge adds at most one point per crossing, and there
+		 * are at most n crossings */
+		cap = 2*n;
+		tmp = (double *) PyMem_Realloc( buf[1], 2*cap*sizeof(double) );
+		if ( tmp == NULL )
+			return -1;
+		buf[1] = tmp;
+
+		n = _polygon_clip_edge( *px, *py, n,
+			k/2, bounds[k], (k%2 == 0) ? 1 : -1, tmp, tmp + cap );
+		*px = tmp;
+		*py = tmp + cap;
+
+		/* swap buffers, the next pass reads what this one wrote */
+		buf[1] = buf[0];
+		buf[0] = tmp;
+	}
+
+	return n;
+}
+
+static PyObject *
+clipped_polygon(struct PyLibPlot *self, PyObject *args)
+{
+	PyObject *ox, *oy;
+	PyObject *x, *y;
+	double bounds[4], *buf[2] = { NULL, NULL };
+	const double *px, *py;
+	npy_intp n;
+
+	if ( !PyArg_ParseTuple( args, "OOdddd", &ox, &oy,
+			&bounds[0], &bounds[1], &bounds[2], &bounds[3] ) )
+		return NULL;
+
+	x = PyArray_ContiguousFromAny( ox, NPY_DOUBLE, 1, 1 );
+	y = PyArray_ContiguousFromAny( oy, NPY_DOUBLE, 1, 1 );
+
+	if ( x == NULL || y == NULL )
+		goto quit;
+
+	n = BGL_MIN( PyArray_SIZE(x), PyArray_SIZE(y) );
+	n = _polygon_clip( (double *)PyArray_DATA(x),
+		(double *)PyArray_DATA(y), n, bounds, buf, &px, &py );
+	if ( n < 0 )
+	{
+		PyErr_NoMemory();
+		goto quit;
+	}
+
+	_polygon_draw( self->pl, px, py, n );
+
+quit:
+	PyMem_Free( buf[0] );
+	PyMem_Free( buf[1] );
+	Py_XDECREF(x);
+	Py_XDECREF(y);
+	if ( PyErr_Occurred() )
+		return NULL;
+    Py_RETURN_NONE;
+}
+
+/*
+ *  The points clipped_polygon would draw, as (x, y) arrays, without
+ *  a plotter.
+ */
+static PyObject *
+clip_polygon(PyObject *self, PyObject *args)
+{
+	PyObject *ox, *oy, *ret;
+	PyObject *x, *y, *cx, *cy;
+	double bounds[4], *buf[2] = { NULL, NULL };
+	const double *px, *py;
+	npy_intp n;
+
+	ret = cx = cy = NULL;
+
+	if ( !PyArg_ParseTuple( args, "OOdddd", &ox, &oy,
+			&bounds[0], &bounds[1], &bounds[2], &bounds[3] ) )
+		return NULL;
+
+	x = PyArray_ContiguousFromAny( ox, NPY_DOUBLE, 1, 1 );
+	y = PyArray_ContiguousFromAny( oy, NPY_DOUBLE, 1, 1 );
+
+	if ( x == NULL || y == NULL )
+		goto quit;
+
+	n = BGL_MIN( PyArray_SIZE(x), PyArray_SIZE(y) );
+	n = _polygon_clip( (double *)PyArray_DATA(x),
+		(double *)PyArray_DATA(y), n, bounds, buf, &px, &py );
+	if ( n < 0 )
+	{
+		PyErr_NoMemory();
+		goto quit;
+	}
+
+	cx = PyArray_SimpleNew( 1, &n, NPY_DOUBLE );
+	cy = PyArray_SimpleNew( 1, &n, NPY_DOUBLE );
+	if ( cx == NULL || cy == NULL )
+		goto quit;
+
+	if ( n > 0 )
+	{
+		memcpy( BGL_DArray1_ptr(cx,0), px, n*sizeof(double) );
+		memcpy( BGL_DArray1_ptr(cy,0), py, n*sizeof(double) );
+	}
+	ret = Py_BuildValue( "OO", cx, cy );
+
+quit:
+	PyMem_Free( buf[0] );
+	PyMem_Free( buf[1] );
+	Py_XDECREF(x);
+	Py_XDECREF(y);
+	Py_XDECREF(cx);
+	Py_XDECREF(cy);
+	return ret;
+}
+
+
 /*
  * Draw a density plot --
  *   Given a grid of intensity values, plot uniform squares tiling
  *   the region (xmin, ymin) to (xmax, ymax).
  *
+ *   The grid may hold floats in [0,1] or bytes in [0,255], which are
+ *   read in place whatever their strides.  Runs of cells in a column
+ *   which share a color are drawn as a single box, and the color is
+ *   only set when it changes.  Cells holding a NaN are left undrawn.
  */
 
+static PyObject *
+_density_grid( PyObject *ogrid, int nd )
+{
+	if ( _bgl_in_place(ogrid, nd)
+			&& PyArray_TYPE((PyArrayObject *)ogrid) == NPY_UBYTE )
+	{
+		Py_INCREF(ogrid);
+		return ogrid;
+	}
+	return _bgl_array( ogrid, nd );
+}
+
+/* the color of a NaN cell, which isn't drawn */
+#define BGL_CLEAR INT_MIN
+
+static void
+_density_rgb( PyObject *grid, npy_intp xi, npy_intp yi, int rgb[3] )
+{
+	int k, type;
+	void *p;
+	double d;
+
+	type = PyArray_TYPE((PyArrayObject *)grid);
+
+	for ( k = 0; k < 3; k++ )
+	{
+		if ( PyArray_NDIM(grid) == 3 )
+			p = PyArray_GETPTR3( grid, xi, yi, k );
+		else
+			p = PyArray_GETPTR2( grid, xi, yi );
+
+		if ( type == NPY_UBYTE )
+			rgb[k] = *(npy_ubyte *)p * 257;
+		else
+		{
+			if ( type == NPY_FLOAT )
+				d = *(float *)p;
+			else
+				d = *(double *)p;
+			if ( d != d )
+			{
+				rgb[0] = rgb[1] = rgb[2] = BGL_CLEAR;
+				return;
+			}
+			rgb[k] = (int) floor( d * 65535 );
+		}
+	}
+}
+
+static void
+_density_draw( plPlotter *pl, PyObject *grid,
+	double xmin, double xmax, double ymin, double ymax )
+{
+	double px, py, py0, dx, dy;
+	npy_intp xi, yi, xn, yn;
+	int rgb[3], next[3], pen[3] = { -1, -1, -1 };
+
+	xn = PyArray_DIM(grid, 0);
+	yn = PyArray_DIM(grid, 1);
+	dx = (xmax - xmin) / xn;
+	dy = (ymax - ymin) / yn;
+
+	pl_filltype_r( pl, 1 );
+
+	for ( xi=0, px=xmin; xi < xn; xi++, px+=dx ) {
+	  yi = 0;
+	  py = ymin;
+	  if ( yn > 0 )
+	    _density_rgb( grid, xi, 0, next );
+
+	  while ( yi < yn ) {
+	    rgb[0] = next[0];
+	    rgb[1] = next[1];
+	    rgb[2] = next[2];
+
+	    py0 = py;
+	    do {
+	      py += dy;
+	      yi++;
+	      if ( yi < yn )
+	        _density_rgb( grid, xi, yi, next );
+	    } while ( yi < yn && next[0] == rgb[0] &&
+	              next[1] == rgb[1] && next[2] == rgb[2] );
+
+	    if ( rgb[0] == BGL_CLEAR )
+	      continue;
+
+	    if ( rgb[0] != pen[0] || rgb[1] != pen[1] || rgb[2] != pen[2] ) {
+	      pl_fillcolor_r( pl, rgb[0], rgb[1], rgb[2] );
+	      pl_pencolor_r ( pl, rgb[0], rgb[1], rgb[2] );
+	      pen[0] = rgb[0];
+	      pen[1] = rgb[1];
+	      pen[2] = rgb[2];
+	    }
+
+	    pl_fbox_r( pl, px, py0, px+dx, py );
+	  }
+	}
+}
+
 static PyObject *
 density_plot(struct PyLibPlot *self, PyObject *args)
 {
 	PyObject *ogrid;
 	PyObject *grid;
 	double xmin, xmax, ymin, ymax;
-	
-	double px, py, dx, dy;
-	npy_intp xi, yi, xn, yn;
-	int    r, g, b;
 
 	if ( !PyArg_ParseTuple( args, "Odddd", &ogrid,
 				&xmin, &xmax, &ymin, &ymax ) )
 		return NULL;
 
-	grid = PyArray_ContiguousFromAny( ogrid, NPY_DOUBLE, 2, 2 );
+	grid = _density_grid( ogrid, 2 );
 
 	if ( grid == NULL )
 		goto quit;
@@ -870,25 +1341,13 @@ density_plot(struct PyLibPlot *self, PyObject *args)
 		printf("Expect a NxM array for densgrid");
 		goto quit;
 	}
-	
-	xn = PyArray_DIM(grid, 0);
-	yn = PyArray_DIM(grid, 1);
-	dx = (xmax - xmin) / xn;
-	dy = (ymax - ymin) / yn;
-	
-	for   ( xi=0, px=xmin; xi < xn; xi++, px+=dx ) {
-	  for ( yi=0, py=ymin; yi < yn; yi++, py+=dy ) {
-	    r=g=b = (int) floor( BGL_DArray2(grid,xi,yi)*65535 );
-	    pl_filltype_r ( self->pl, 1.0 );
-	    pl_fillcolor_r( self->pl, r, g, b );
-	    pl_pencolor_r ( self->pl, r, g, b );
-
-	    pl_fbox_r( self->pl, px, py, px+dx, py+dy );
-	  }
-	}
+
+	_density_draw( self->pl, grid, xmin, xmax, ymin, ymax );
 
 quit:
 	Py_XDECREF(grid);
+	if ( PyErr_Occurred() )
+		return NULL;
     Py_RETURN_NONE;
 }
 
@@ -898,45 +1357,27 @@ color_density_plot(struct PyLibPlot *self, PyObject *args)
 	PyObject *ogrid;
 	PyObject *grid;
 	double xmin, xmax, ymin, ymax;
-	
-	double px, py, dx, dy;
-	npy_intp xi, yi, xn, yn;
-	int    r, g, b;
 
 	if ( !PyArg_ParseTuple( args, "Odddd", &ogrid,
 				&xmin, &xmax, &ymin, &ymax ) )
 		return NULL;
 
-	grid = PyArray_ContiguousFromAny( ogrid, NPY_DOUBLE, 3, 3 );
+	grid = _density_grid( ogrid, 3 );
 
 	if ( grid == NULL )
 		goto quit;
 
-	if ( PyArray_NDIM(grid) != 3) {
+	if ( PyArray_NDIM(grid) != 3 || PyArray_DIM(grid, 2) < 3 ) {
 		printf("Expect a NxMx3 array for color densgrid");
 		goto quit;
 	}
-	
-	xn = PyArray_DIM(grid, 0);
-	yn = PyArray_DIM(grid, 1);
-	dx = (xmax - xmin) / xn;
-	dy = (ymax - ymin) / yn;
-	
-	for   ( xi=0, px=xmin; xi < xn; xi++, px+=dx ) {
-	  for ( yi=0, py=ymin; yi < yn; yi++, py+=dy ) {
-	    r = (int) floor( BGL_DArray3(grid,xi,yi,0)*65535 );
-	    g = (int) floor( BGL_DArray3(grid,xi,yi,1)*65535 );
-	    b = (int) floor( BGL_DArray3(grid,xi,yi,2)*65535 );
-	    pl_filltype_r ( self->pl, 1.0 );
-	    pl_fillcolor_r( self->pl, r, g, b );
-	    pl_pencolor_r ( self->pl, r, g, b );
-
-	    pl_fbox_r( self->pl, px, py, px+dx, py+dy );
-	  }
-	}
+
+	_density_draw( self->pl, grid, xmin, xmax, ymin, ymax );
 
 quit:
 	Py_XDECREF(grid);
+	if ( PyErr_Occurred() )
+		return NULL;
     Py_RETURN_NONE;
 }
 
@@ -952,6 +1393,7 @@ static PyMethodDef PyLibPlot_methods[] = {
 	{ "flush", (PyCFunction)flush, METH_NOARGS ,""},
 	{ "gsave", (PyCFunction)gsave, METH_NOARGS ,""},
 	{ "grestore", (PyCFunction)grestore, METH_NOARGS ,""},
+	{ "endpath", (PyCFunction)endpath, METH_NOARGS ,""},
 	{ "begin_page", (PyCFunction)begin_page, METH_NOARGS, "open page on device" },
 
 	// (i)
@@ -1005,10 +1447,15 @@ static PyMethodDef PyLibPlot_methods[] = {
 
 	{ "symbols", (PyCFunction)symbols, METH_VARARGS ,""},
 	{ "clipped_symbols", (PyCFunction)clipped_symbols, METH_VARARGS ,""},
+	{ "colored_symbols", (PyCFunction)colored_symbols, METH_VARARGS ,""},
 	{ "clipped_colored_symbols", (PyCFunction)clipped_colored_symbols, METH_VARARGS ,""},
 
 	{ "curve", (PyCFunction)curve, METH_VARARGS ,""},
 	{ "clipped_curve", (PyCFunction)clipped_curve, METH_VARARGS ,""},
+	{ "segments", (PyCFunction)segments, METH_VARARGS ,""},
+	{ "clipped_segments", (PyCFunction)clipped_segments, METH_VARARGS ,""},
+	{ "polygon", (PyCFunction)polygon, METH_VARARGS ,""},
+	{ "clipped_polygon", (PyCFunction)clipped_polygon, METH_VARARGS ,""},
 
 	{ "density_plot",	(PyCFunction)density_plot,		METH_VARARGS ,""},
 	{ "color_density_plot", (PyCFunction)color_density_plot,	METH_VARARGS ,""},
@@ -1067,6 +1514,7 @@ static PyTypeObject PyLibPlotType = {
 
 /* module functions, not methods of the type */
 static PyMethodDef libplot_methods[] = {
+	{ "clip_polygon", (PyCFunction)clip_polygon, METH_VARARGS ,""},
     {NULL}  /* Sentinel */
 };
 
@@ -0,0 +1,172 @@
+#
+# Advance widths of the libplot Hershey serif fonts.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA  02111-1307, USA.
+#
+
+#
+# Lets string widths be computed without a libplot device.  The widths
+# are the right minus left bearings of the public domain Hershey glyphs
+# libplot draws these fonts with (complex roman and italic, triplex
+# roman and italic, complex greek), in Hershey units.  libplot's em is
+# 33 Hershey units.
+#
+
+import re
+
+HERSHEY_EM = 33.
+
+# libplot shrinks sub- and superscripts by this factor
+SCRIPT_SIZE = 0.6
+
+# widths of ASCII 32 (space) to 126 (tilde)
+_ascii_widths = {
+    "hersheyserif": [
+        16, 10, 18, 21, 20, 24, 25, 8, 14, 14, 16, 26, 8, 26, 8, 22,
+        20, 20, 20, 20, 20, 20, 20, 20, 20, 20, 8, 8, 24, 26, 24, 18,
+        27, 20, 22, 21, 22, 21, 20, 23, 24, 11, 15, 22, 18, 25, 23, 22,
+        22, 22, 22, 20, 19, 24, 20, 24, 20, 21, 20, 14, 14, 14, 22, 20,
+        12, 20, 21, 19, 21, 19, 13, 19, 22, 11, 11, 21, 11, 33, 22, 20,
+        21, 20, 17, 17, 15, 22, 18, 24, 20, 19, 18, 14, 8, 14, 24,
+    ],
+    "hersheyserif-italic": [
+        16, 11, 18, 21, 21, 24, 25, 9, 15, 15, 16, 26, 11, 26, 11, 22,
+        21, 21, 21, 21, 21, 21, 21, 21, 21, 21, 11, 11, 24, 26, 24, 21,
+        27, 20, 24, 21, 23, 23, 22, 22, 26, 13, 18, 23, 20, 27, 25, 22,
+        23, 22, 24, 23, 21, 25, 20, 26, 22, 21, 22, 14, 14, 14, 22, 20,
+        12, 21, 19, 18, 21, 18, 15, 20, 21, 13, 13, 20, 12, 33, 23, 18,
+        21, 20, 17, 17, 14, 23, 20, 29, 20, 21, 20, 14, 8, 14, 24,
+    ],
+    "hersheyserif-bold": [
+        16, 11, 18, 21, 20, 24, 26, 9, 14, 14, 16, 25, 11, 26, 11, 23,
+        20, 20, 20, 20, 20, 20, 20, 20, 20, 20, 11, 11, 24, 25, 24, 19,
+        27, 20, 22, 21, 22, 21, 20, 23, 24, 12, 16, 22, 18, 26, 24, 22,
+        22, 22, 22, 20, 20, 24, 20, 24, 20, 22, 20, 14, 14, 14, 22, 20,
+        12, 20, 21, 19, 21, 19, 14, 19, 23, 12, 13, 22, 12, 34, 23, 20,
+        21, 20, 17, 17, 15, 23, 18, 24, 20, 19, 18, 14, 8, 14, 24,
+    ],
+    "hersheyserif-bolditalic": [
+        16, 11, 18, 21, 21, 24, 26, 9, 16, 16, 17, 25, 11, 26, 11, 23,
+        21, 21, 21, 21, 21, 21, 21, 21, 21, 21, 11, 11, 24, 25, 24, 21,
+        27, 20, 24, 21, 23, 23, 22, 22, 26, 14, 19, 23, 20, 28, 25, 22,
+        23, 22, 24, 23, 22, 25, 20, 26, 22, 22, 22, 14, 14, 14, 22, 20,
+        12, 22, 19, 18, 22, 18, 16, 21, 22, 13, 13, 22, 12, 35, 24, 20,
+        22, 21, 18, 17, 14, 24, 20, 30, 22, 22, 20, 14, 8, 14, 24,
+    ],
+}
+
+# greek letters, by their \*X escape (the PostScript Symbol font layout)
+_greek_widths = dict(zip(
+    "ABCDEFGHIKLMNOPQRSTUWXYZabcdefghiklmnopqrstuwxyz",
+    [20, 22, 20, 20, 21, 21, 18, 24, 11, 22, 20, 25, 23, 22, 24, 22,
+     22, 21, 19, 19, 22, 22, 23, 20, 23, 21, 18, 19, 18, 22, 20, 22,
+     12, 20, 20, 23, 20, 18, 22, 23, 19, 21, 20, 20, 23, 17, 23, 18]))
+
+_char_widths = {}
+for _face, _widths in _ascii_widths.items():
+    _char_widths[_face] = dict(zip(map(chr, range(32, 127)), _widths))
+
+# the \f0 - \f4 fonts of the HersheySerif typeface; 0 is the symbol font
+_typeface = [None, "hersheyserif", "hersheyserif-italic",
+             "hersheyserif-bold", "hersheyserif-bolditalic"]
+
+_font_escape = {"0": 0, "1": 1, "2": 2, "3": 3, "4": 4,
+                "R": 1, "I": 2, "B": 3}
+
+# horizontal shifts, in ems
+_shift_escape = {"1": 1., "2": 1. / 2, "4": 1. / 4,
+                 "6": 1. / 6, "8": 1. / 8, "^": 1. / 12}
+
+_re_escape = re.compile(r"\\(\\|..)", re.S)
+
+# every glyph in the tables, and each construct string_width handles;
+# widths just add up, so a device which measures all of these as the
+# tables do can be measured with the tables
+check_strings = \
+    [chr(i) for i in range(32, 127) if chr(i) != '\\'] + [r'\\'] + \
+    [r'\*' + c for c in sorted(_greek_widths.keys())] + \
+    [r'x\sp2\ep', r'x\sbi\eb', r'x\mk\sp2\ep\rt\sbi\eb',
+     r'e\sp\*p\sbx\eb\ep', r'\f2A\f1A\f3A\f4A\fRA\fIA\fBA',
+     r'A\r1A\r2A\r4A\r6A\r8A\r^A', r'AAAA\l1A\l2A\l4A\l6A\l8A\l^A']
+
+
+def has_metrics(face):
+    return face is not None and _char_widths.has_key(face.lower())
+
+
+def string_width(plstr, size, face="HersheySerif"):
+    """Width of the libplot string `plstr`, in the units of `size`.
+
+    Returns None if `plstr` uses a character or escape sequence which is
+    not in the tables, in which case the device has to measure it.
+    """
+    if face is None:
+        return None
+    face = face.lower()
+    widths = _char_widths.get(face)
+    if widths is None:
+        return None
+
+    width = 0.
+    scale = 1.
+    scale_stack = []
+    mark = 0.
+    pos = 0
+    n = len(plstr)
+    while pos < n:
+        c = plstr[pos]
+        if c != '\\':
+            w = widths.get(c)
+            if w is None:
+                return None
+            width = width + scale * w
+            pos = pos + 1
+            continue
+
+        m = _re_escape.match(plstr, pos)
+        if m is None:
+            return None
+        esc = m.group(1)
+        pos = m.end()
+        if esc == '\\':
+            width = width + scale * widths['\\']
+        elif esc == "sp" or esc == "sb":
+            scale_stack.append(scale)
+            scale = scale * SCRIPT_SIZE
+        elif esc == "ep" or esc == "eb":
+            if scale_stack:
+                scale = scale_stack.pop()
+        elif esc == "mk":
+            mark = width
+        elif esc == "rt":
+            width = mark
+        elif esc[0] == 'f' and _font_escape.has_key(esc[1]):
+            font = _typeface[_font_escape[esc[1]]]
+            if font is None:
+                return None
+            widths = _char_widths[font]
+        elif esc[0] == '*' and _greek_widths.has_key(esc[1]):
+            width = width + scale * _greek_widths[esc[1]]
+        elif esc[0] in "rl" and _shift_escape.has_key(esc[1]):
+            shift = scale * HERSHEY_EM * _shift_escape[esc[1]]
+            if esc[0] == 'r':
+                width = width + shift
+            else:
+                width = width - shift
+        else:
+            return None
+
+    return width * size / HERSHEY_EM
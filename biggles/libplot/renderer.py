@@ -19,74 +19,50 @@
 # Boston, MA  02111-1307, USA.
 #
 
+import itertools
 import math
+import threading
 from ._libplot_pywrap import Plotter
 
 from .tex2libplot import tex2libplot
+from . import hershey
 
-# polygon clipping
 
-
-def sh_inside(p, dim, boundary, side):
-    return side * p[dim] >= side * boundary
-
-
-def sh_intersection(s, p, dim, boundary):
-    mid = not dim
-    g = 0.
-    if p[dim] != s[dim]:
-        g = (boundary - s[dim]) / (p[dim] - s[dim])
-    q = [0, 0]
-    q[dim] = boundary
-    q[mid] = s[mid] + g * (p[mid] - s[mid])
-    return q[0], q[1]
-
-
-def sutherland_hodgman(polygon, dim, boundary, side):
-    out = []
-    s = polygon[-1]
-    s_inside = sh_inside(s, dim, boundary, side)
-    for p in polygon:
-        p_inside = sh_inside(p, dim, boundary, side)
-
-        crosses = (p_inside and not s_inside) or \
-                  (not p_inside and s_inside)
-        if crosses:
-            out.append(sh_intersection(s, p, dim, boundary))
-
-        if p_inside:
-            out.append(p)
-
-        s = p
-        s_inside = p_inside
-
-    return out
+# marks a key that was unset before a save, or whose libplot value is unknown
+_unset = object()
 
 
 class RendererState(object):
+    """Flattened view of the effective state.
+
+    Each save() pushes an undo record holding the values the keys set
+    since then had before, so get() is a single dictionary lookup no
+    matter how deep the save stack is.
+    """
 
     def __init__(self):
         self.current = {}
         self.saved = []
 
     def set(self, name, value):
+        if self.saved:
+            undo = self.saved[-1]
+            if not undo.has_key(name):
+                undo[name] = self.current.get(name, _unset)
         self.current[name] = value
 
     def get(self, name, notfound=None):
-        if self.current.has_key(name):
-            return self.current[name]
-        for i in range(len(self.saved)):
-            d = self.saved[i]
-            if d.has_key(name):
-                return d[name]
-        return notfound
+        return self.current.get(name, notfound)
 
     def save(self):
-        self.saved.insert(0, self.current)
-        self.current = {}
+        self.saved.append({})
 
     def restore(self):
-        self.current = self.saved.pop(0)
+        for name, value in self.saved.pop().items():
+            if value is _unset:
+                self.current.pop(name, None)
+            else:
+                self.current[name] = value
 
 
 def _hexcolor(hextriplet, scale=1):
@@ -141,6 +117,103 @@ def _set_line_type(pl, type):
     pl.set_line_type(pl_type)
 
 
+class _LRUCache(object):
+    """Bounded mapping which forgets the least recently used key first.
+
+    The caches are shared by every renderer, so each method holds a lock
+    while it relinks the list.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            # links are [prev, next, key, value]; root.next is the oldest
+            self.root = root = []
+            root[:] = [root, root, None, None]
+            self.links = {}
+            self.hits = 0
+            self.misses = 0
+
+    def get(self, key, notfound=None):
+        with self.lock:
+            link = self.links.get(key)
+            if link is None:
+                self.misses += 1
+                return notfound
+            self.hits += 1
+            prev, next = link[0], link[1]
+            prev[1] = next
+            next[0] = prev
+            self._append(link)
+            return link[3]
+
+    def put(self, key, value):
+        with self.lock:
+            if self.links.has_key(key):
+                self.links[key][3] = value
+                return
+            if len(self.links) >= self.maxsize:
+                oldest = self.root[1]
+                self.root[1] = oldest[1]
+                oldest[1][0] = self.root
+                del self.links[oldest[2]]
+            link = [None, None, key, value]
+            self._append(link)
+            self.links[key] = link
+
+    def _append(self, link):
+        last = self.root[0]
+        last[1] = self.root[0] = link
+        link[0] = last
+        link[1] = self.root
+
+    def info(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "maxsize": self.maxsize,
+                "size": len(self.links),
+            }
+
+# tex2libplot output, keyed on the TeX string
+_tex_cache = _LRUCache(1024)
+
+# string widths, keyed on (device type, font face, font size, string)
+_width_cache = _LRUCache(4096)
+
+
+def _tex2libplot(str):
+    plstr = _tex_cache.get(str)
+    if plstr is None:
+        plstr = tex2libplot(str)
+        _tex_cache.put(str, plstr)
+    return plstr
+
+
+def text_cache_info():
+    """Hit/miss statistics for the text translation and width caches."""
+    return {"tex2libplot": _tex_cache.info(), "textwidth": _width_cache.info()}
+
+
+def clear_text_cache():
+    _tex_cache.clear()
+    _width_cache.clear()
+    _hershey_checked.clear()
+
+
+# whether the Hershey tables match the device, by device type and face
+_hershey_checked = {}
+
+
+# every page gets a fresh id, so cached device objects never outlive it
+_page_ids = itertools.count(1)
+
+
 class LibplotRenderer(Plotter):
 
     def __init__(self, ll, ur, type='X', parameters=None, file=None):
@@ -151,10 +224,16 @@ class LibplotRenderer(Plotter):
 
         self.lowerleft = ll
         self.upperright = ur
+        self.type = type
         super(LibplotRenderer, self).__init__(type, parameters, filename)
 
     def open(self):
         self.state = RendererState()
+        # what libplot itself currently has, and whether each open
+        # save_state() has really issued a gsave yet
+        self.pl_state = RendererState()
+        self.pl_saved = []
+        self.page_id = next(_page_ids)
         self.begin_page()
         args = self.lowerleft + self.upperright
         self.space(*args)
@@ -185,9 +264,22 @@ class LibplotRenderer(Plotter):
         "textangle": Plotter.set_string_angle,
     }
 
+    # libplot setters which also change the libplot value of other keys
+    __pl_style_shadows = {
+        "color": ("linecolor", "fillcolor"),
+        "linecolor": ("color",),
+        "fillcolor": ("color",),
+    }
+
     def set(self, key, value):
         self.state.set(key, value)
         if LibplotRenderer.__pl_style_func.has_key(key):
+            if self.pl_state.get(key, _unset) == value:
+                return
+            self._pl_touch()
+            for other in LibplotRenderer.__pl_style_shadows.get(key, ()):
+                self.pl_state.set(other, _unset)
+            self.pl_state.set(key, value)
             method = LibplotRenderer.__pl_style_func[key]
             method(self, value)
 
@@ -195,12 +287,30 @@ class LibplotRenderer(Plotter):
         return self.state.get(parameter, notfound)
 
     def save_state(self):
+        # the gsave is deferred until libplot state actually changes
         self.state.save()
-        self.gsave()
+        self.pl_state.save()
+        self.pl_saved.append(False)
 
     def restore_state(self):
         self.state.restore()
-        self.grestore()
+        self.pl_state.restore()
+        if self.pl_saved.pop():
+            self.grestore()
+        else:
+            # grestore would have ended the path; keep that behavior
+            self.endpath()
+
+    def _pl_touch(self):
+        if self.pl_saved and not self.pl_saved[-1]:
+            self.gsave()
+            self.pl_saved[-1] = True
+
+    def _pl_clobber(self, *keys):
+        # for primitives which set libplot state behind our back
+        self._pl_touch()
+        for key in keys:
+            self.pl_state.set(key, _unset)
 
     # drawing commands
 
@@ -298,10 +408,10 @@ class LibplotRenderer(Plotter):
         else:
             type = LibplotRenderer.__pl_symbol_type.get(type_str)
 
+        self._pl_clobber("color", "linecolor", "fillcolor")
         cr = self.get("cliprect")
         if cr is None:
-            # This will cause an error: not written yet
-            super(LibplotRenderer, self).colored_symbols(x, y, type, size)
+            super(LibplotRenderer, self).colored_symbols(x, y, c, type, size)
         else:
             self.clipped_colored_symbols(x, y, c,
                                          type, size,
@@ -309,9 +419,11 @@ class LibplotRenderer(Plotter):
                                          cr[2], cr[3])
 
     def density_plot(self, densgrid, ((xmin, ymin), (xmax, ymax))):
+        self._pl_clobber("color", "linecolor", "fillcolor", "filltype")
         super(LibplotRenderer, self).density_plot(densgrid, xmin, xmax, ymin, ymax)
 
     def color_density_plot(self, densgrid, ((xmin, ymin), (xmax, ymax))):
+        self._pl_clobber("color", "linecolor", "fillcolor", "filltype")
         super(LibplotRenderer, self).color_density_plot(densgrid,
                                                         xmin, xmax, ymin, ymax)
 
@@ -323,16 +435,21 @@ class LibplotRenderer(Plotter):
             self.clipped_curve(x, y,
                                cr[0], cr[1], cr[2], cr[3])
 
-    def polygon(self, points):
-        pts = points
+    def segments(self, x0, y0, x1, y1):
+        cr = self.get("cliprect")
+        if cr is None:
+            super(LibplotRenderer, self).segments(x0, y0, x1, y1)
+        else:
+            self.clipped_segments(x0, y0, x1, y1,
+                                  cr[0], cr[1], cr[2], cr[3])
+
+    def polygon(self, x, y):
         cr = self.get("cliprect")
-        if cr is not None:
-            pts = sutherland_hodgman(pts, 0, cr[0], +1)
-            pts = sutherland_hodgman(pts, 0, cr[1], -1)
-            pts = sutherland_hodgman(pts, 1, cr[2], +1)
-            pts = sutherland_hodgman(pts, 1, cr[3], -1)
-        self.move(pts[0])
-        map(self.lineto, pts[1:])
+        if cr is None:
+            super(LibplotRenderer, self).polygon(x, y)
+        else:
+            self.clipped_polygon(x, y,
+                                 cr[0], cr[1], cr[2], cr[3])
 
     # text commands
 
@@ -346,7 +463,7 @@ class LibplotRenderer(Plotter):
     }
 
     def text(self, p, str):
-        plstr = tex2libplot(str)
+        plstr = _tex2libplot(str)
         hstr = self.state.get("texthalign", "center")
         vstr = self.state.get("textvalign", "center")
         hnum = LibplotRenderer.__pl_text_align.get(hstr)
@@ -355,8 +472,35 @@ class LibplotRenderer(Plotter):
         self.string(hnum, vnum, plstr)
 
     def textwidth(self, str):
-        plstr = tex2libplot(str)
-        return self.get_string_width(plstr)
+        face = self.state.get("fontface")
+        size = self.state.get("fontsize")
+        key = (self.type, face, size, str)
+        width = _width_cache.get(key)
+        if width is None:
+            plstr = _tex2libplot(str)
+            if size is not None and self._hershey_ok(face, size):
+                width = hershey.string_width(plstr, size, face)
+            if width is None:
+                width = self.get_string_width(plstr)
+            _width_cache.put(key, width)
+        return width
+
+    def _hershey_ok(self, face, size):
+        # the tables are only trusted once the device has measured every
+        # glyph in them the same way; otherwise it measures everything
+        if not hershey.has_metrics(face):
+            return False
+        key = (self.type, face.lower())
+        ok = _hershey_checked.get(key)
+        if ok is None:
+            ok = True
+            for plstr in hershey.check_strings:
+                width = hershey.string_width(plstr, size, face)
+                if abs(width - self.get_string_width(plstr)) > 1e-3 * size:
+                    ok = False
+                    break
+            _hershey_checked[key] = ok
+        return ok
 
     def textheight(self, str):
         return self.state.get("fontsize")  # XXX: kludge?
@@ -30,7 +30,7 @@ import string
 
 class TeXLexer(object):
 
-    re_control_sequence = re.compile(r"^\\[a-zA-Z]+[ ]?|^\\[^a-zA-Z][ ]?")
+    re_token = re.compile(r"\\[a-zA-Z]+[ ]?|\\[^a-zA-Z][ ]?|.", re.S)
 
     def __init__(self, str):
         self.str = str
@@ -39,23 +39,18 @@ class TeXLexer(object):
         self.token_stack = []
 
     def get_token(self):
-        if self.pos == self.len:
-            return None
-
         if len(self.token_stack) > 0:
             return self.token_stack.pop()
 
-        str = self.str[self.pos:]
-        m = self.re_control_sequence.match(str)
-        if m is not None:
-            token = m.group()
-            self.pos = self.pos + len(token)
-            # consume trailing space
-            if len(token) > 2 and token[-1] == ' ':
-                token = token[:-1]
-        else:
-            token = str[0]
-            self.pos = self.pos + 1
+        if self.pos == self.len:
+            return None
+
+        m = self.re_token.match(self.str, self.pos)
+        token = m.group()
+        self.pos = m.end()
+        # consume trailing space
+        if len(token) > 2 and token[-1] == ' ':
+            token = token[:-1]
 
         return token
 
@@ -361,7 +356,7 @@ def map_math_token(token):
 
 
 def math_group(lexer):
-    output = ''
+    output = []
     bracketmode = 0
     while 1:
         token = lexer.get_token()
@@ -373,16 +368,16 @@ def math_group(lexer):
         elif token == '}':
             break
         else:
-            output = output + map_math_token(token)
+            output.append(map_math_token(token))
             if not bracketmode:
                 break
-    return output
+    return ''.join(output)
 
 font_code = [r'\f0', r'\f1', r'\f2', r'\f3']
 
 
 def tex2libplot(str):
-    output = ''
+    output = []
     mathmode = 0
     font_stack = []
     font = 1
@@ -426,6 +421,6 @@ def tex2libplot(str):
         else:
             append = map_math_token(token)
 
-        output = output + append
+        output.append(append)
 
-    return output
+    return ''.join(output)
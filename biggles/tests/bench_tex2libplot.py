@@ -0,0 +1,35 @@
+"""
+Time tex2libplot on long labels built from its whole vocabulary.
+
+    python -m biggles.tests.bench_tex2libplot
+
+The time per character should stay flat as the labels get longer.
+"""
+import timeit
+
+from biggles.libplot import tex2libplot as t2l
+
+
+def _label(n):
+    vocab = sorted(t2l._text_token_dict) + sorted(t2l._common_token_dict)
+    math = sorted(t2l._math_token_dict)
+    parts = []
+    i = 0
+    while sum(map(len, parts)) < n:
+        parts.append(vocab[i % len(vocab)] + ' ')
+        m = math[i % len(math)]
+        parts.append('$%s_{%s}^2 x$' % (m, math[(i + 1) % len(math)]))
+        i = i + 1
+    return ''.join(parts)
+
+
+def bench():
+    for n in (100, 1000, 10000, 100000):
+        s = _label(n)
+        number = max(1, 100000 // n)
+        t = timeit.timeit(lambda: t2l.tex2libplot(s), number=number) / number
+        print("%7d chars  %9.3f ms  %6.3f us/char"
+              % (len(s), 1e3 * t, 1e6 * t / len(s)))
+
+if __name__ == '__main__':
+    bench()
@@ -374,6 +374,878 @@ class ExampleTests(unittest.TestCase):
 
         _write_example(12, p)
 
+    def test_modify_after_write(self):
+        x = numpy.arange(0, 3 * numpy.pi, numpy.pi / 30)
+
+        p = biggles.FramedPlot()
+        c = biggles.Curve(x, numpy.cos(x))
+        p.add(c)
+        _write_example('modify', p)
+
+        # components cache their device objects; changes must show up
+        c.y = numpy.sin(x)
+        c.style(color='red')
+        p.x1.label = 'x'
+        _write_example('modify', p)
+
+        c.y[:] = 0.
+        c.invalidate()
+        _write_example('modify', p)
+
+    def test_fill(self):
+        x = numpy.linspace(0, 4 * numpy.pi, 100000)
+        y = numpy.sin(x)
+
+        p = biggles.FramedPlot()
+        p.yrange = -0.5, 0.5
+
+        p.add(biggles.FillAbove(x, y, color="light blue"))
+        p.add(biggles.FillBelow(x, y, color="pink"))
+        p.add(biggles.FillBetween(x, 0.5 * y, list(x), list(0.25 * y)))
+
+        _write_example('fill', p)
+
+    def test_clip_polygon(self):
+        from biggles.libplot._libplot_pywrap import clip_polygon
+
+        def clip(points, xmin, xmax, ymin, ymax):
+            # Sutherland-Hodgman, one edge of the rectangle at a time
+            edges = [(0, xmin, 1), (0, xmax, -1), (1, ymin, 1), (1, ymax, -1)]
+            for dim, boundary, side in edges:
+                if len(points) == 0:
+                    break
+                inside = lambda p: side * p[dim] >= side * boundary
+                out = []
+                s = points[-1]
+                for e in points:
+                    if inside(e) != inside(s):
+                        g = (boundary - s[dim]) / (e[dim] - s[dim])
+                        q = [0., 0.]
+                        q[dim] = boundary
+                        q[1 - dim] = s[1 - dim] + g * (e[1 - dim] - s[1 - dim])
+                        out.append(tuple(q))
+                    if inside(e):
+                        out.append(e)
+                    s = e
+                points = out
+            return points
+
+        square = [(1., 1.), (2., 1.), (2., 2.), (1., 2.)]
+        polygons = [
+            # fully inside, fully outside, straddling the lower left corner
+            (square, 0., 4., 0., 3.),
+            (square, 3., 4., 0., 3.),
+            (square, 1.5, 4., 1.25, 3.),
+            # concave: a U whose arms both cross the top edge
+            ([(0., 0.), (3., 0.), (3., 3.), (2., 3.), (2., 1.),
+              (1., 1.), (1., 3.), (0., 3.)], -1., 4., -1., 2.),
+            # concave, crossing every edge
+            ([(0., -1.), (1., 1.5), (2., -1.), (3., 1.), (1., 3.),
+              (-1., 1.)], 0.25, 2.5, -0.5, 2.)]
+
+        for points, xmin, xmax, ymin, ymax in polygons:
+            x, y = zip(*points)
+            cx, cy = clip_polygon(x, y, xmin, xmax, ymin, ymax)
+            expected = clip(points, xmin, xmax, ymin, ymax)
+            self.assertEqual(len(cx), len(expected))
+            if expected:
+                ex, ey = zip(*expected)
+                self.assertTrue(numpy.allclose(cx, ex))
+                self.assertTrue(numpy.allclose(cy, ey))
+
+        x, y = zip(*square)
+        self.assertEqual(len(clip_polygon(x, y, 3., 4., 0., 3.)[0]), 0)
+        cx, cy = clip_polygon(x, y, 0., 4., 0., 3.)
+        self.assertEqual(list(zip(cx, cy)), square)
+
+    def test_errorbars(self):
+        x = numpy.linspace(1, 100, 1000)
+        y = numpy.log(x)
+        err = 0.1 * x
+
+        p = biggles.FramedPlot()
+        p.xlog = True
+        p.yrange = 0, 4
+
+        p.add(biggles.SymmetricErrorBarsX(x, y, err, color="blue"))
+        p.add(biggles.SymmetricErrorBarsY(x, y, 0.1 * y, color="red"))
+
+        _write_example('errorbars', p)
+
+    def test_limits(self):
+        x = numpy.arange(1, 20)
+        y = numpy.sqrt(x)
+
+        p = biggles.FramedPlot()
+        p.frame.draw_grid = 1
+        p.x1.ticks = 10
+
+        p.add(biggles.UpperLimits(x, y + 1, color="red"))
+        p.add(biggles.LowerLimits(x, y - 1, color="blue"))
+
+        _write_example('limits', p)
+
+    def test_decimate(self):
+        from biggles.biggles import _decimate_path
+
+        x = numpy.linspace(0, 1, 1000000)
+        y = numpy.cumsum(numpy.random.normal(size=x.size))
+        y[500] = 1e4
+        y[501] = numpy.nan
+
+        # each device column keeps its first, last, lowest and highest
+        u = 500 * x
+        du, dy = _decimate_path(u, y)
+        self.assertTrue(len(du) <= 4 * 501 + 1)
+        self.assertEqual((du[0], dy[0]), (u[0], y[0]))
+        self.assertEqual((du[-1], dy[-1]), (u[-1], y[-1]))
+        self.assertTrue(numpy.isnan(dy).sum() == 1)
+        col, dcol = numpy.floor(u), numpy.floor(du)
+        for c in range(0, 501, 7):
+            self.assertEqual(numpy.nanmin(y[col == c]),
+                             numpy.nanmin(dy[dcol == c]))
+            self.assertEqual(numpy.nanmax(y[col == c]),
+                             numpy.nanmax(dy[dcol == c]))
+        self.assertTrue(1e4 in dy)
+
+        p = biggles.FramedPlot()
+        p.add(biggles.Curve(x, y, decimate=True))
+
+        _write_example('decimate', p)
+
+    def test_dedup(self):
+        n = 1000000
+        x = numpy.random.normal(size=n)
+        y = numpy.random.normal(size=n)
+        c = numpy.random.uniform(size=(n, 3))
+
+        a = biggles.FramedArray(1, 2)
+        points = biggles.Points(x, y, type="dot", dedup=True)
+        colored = biggles.ColoredPoints(x, y, c, type="dot", dedup=True)
+        a[0, 0].add(points)
+        a[0, 1].add(colored)
+
+        _write_example('dedup', a)
+
+        # at most one symbol per device cell
+        for comp in points, colored:
+            obj, = comp.device_objects
+            cells = set(zip(numpy.floor(obj.x), numpy.floor(obj.y)))
+            self.assertEqual(len(cells), len(obj.x))
+            self.assertTrue(len(obj.x) < n)
+
+        # and it is the last one drawn there
+        from biggles.biggles import _last_in_cell
+        u = numpy.random.uniform(0, 30, size=5000)
+        v = numpy.random.uniform(0, 20, size=5000)
+        last = {}
+        for k, cell in enumerate(zip(numpy.floor(u), numpy.floor(v))):
+            last[cell] = k
+        self.assertEqual(list(_last_in_cell(u, v)), sorted(last.values()))
+
+    def test_palette(self):
+        n = 10000
+        x = numpy.random.normal(size=n)
+        y = numpy.random.normal(size=n)
+        c = numpy.random.randint(0, 3, size=n)
+        palette = [[1., 0., 0.], [0., 0.6, 0.], [0., 0., 1.]]
+
+        p = biggles.FramedPlot()
+        points = biggles.ColoredPoints(x, y, c, palette=palette,
+                                       type="filled circle", size=0.5)
+        p.add(points)
+
+        _write_example('palette', p)
+
+        # the points are drawn grouped, one color change per entry
+        obj, = points.device_objects
+        changes = numpy.any(obj.c[1:] != obj.c[:-1], axis=1).sum()
+        self.assertEqual(changes, len(palette) - 1)
+        self.assertEqual(len(obj.x), n)
+
+        for bad in -1, 3:
+            c[0] = bad
+            self.assertRaises(ValueError, biggles.ColoredPoints,
+                              x, y, c, palette=palette)
+
+    def test_density(self):
+        x, y = numpy.mgrid[-1:1:400j, -1:1:300j]
+        r = numpy.sqrt(x ** 2 + y ** 2)
+        gray = numpy.floor(8 * r) / 16.
+        color = numpy.zeros((400, 300, 3), numpy.uint8)
+        color[..., 0] = 255 * (r < 0.5)
+        color[..., 2] = 255 * (x > 0)
+
+        a = biggles.FramedArray(1, 2)
+        a[0, 0].add(biggles.Density(gray, [[-1, -1], [1, 1]]))
+        a[0, 1].add(biggles.Density(color, [[-1, -1], [1, 1]]))
+
+        _write_example('density', a)
+
+    def test_contours(self):
+        x = numpy.linspace(-1, 1, 41)
+        y = numpy.linspace(-1, 1, 31)
+        z = x[:, numpy.newaxis] ** 2 + y[numpy.newaxis, :] ** 2
+
+        lines = biggles.Contour(x, y, z, 0.5)._get_contours()
+        self.assertEqual(len(lines), 1)
+        lx, ly = lines[0]
+        self.assertEqual((lx[0], ly[0]), (lx[-1], ly[-1]))
+
+        plane = x[:, numpy.newaxis] + 2 * y[numpy.newaxis, :]
+        lines = biggles.Contour(x, y, plane, 0.3)._get_contours()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(biggles.Contour(x, y, z, 10.)._get_contours(), [])
+
+        p = biggles.FramedPlot()
+        c = biggles.Contours(z, x, y)
+        c.levels = [1., 0.25, 0.5, 0.25, 10.]
+        p.add(c)
+        _write_example('contours', p)
+
+        # all the levels are contoured in one pass
+        self.assertEqual(len(c.device_objects), 5)
+        for level in c.device_objects:
+            lines = biggles.Contour(x, y, z, level.z0)._get_contours()
+            self.assertEqual(len(level._lines), len(lines))
+            for (lx, ly), (mx, my) in zip(level._lines, lines):
+                self.assertTrue(numpy.array_equal(lx, mx))
+                self.assertTrue(numpy.array_equal(ly, my))
+
+        # redrawing reuses the lines until the data changes
+        memo = c._memo
+        _write_example('contours', p)
+        self.assertTrue(c._memo is memo)
+        c.invalidate()
+        self.assertTrue(c._memo is None)
+        c.z = z + 1.
+        _write_example('contours', p)
+        self.assertFalse(c._memo[0] == memo[0])
+
+    def test_contour_stitching(self):
+        from biggles.contour import _biggles
+
+        def old_lines(x, y, z, z0):
+            # the exact endpoint stitcher the grid position hash replaced
+            segs = _biggles.contour_segments(x, y, z, z0)
+            open = [[segs[0][0], segs[0][1]]]
+            closed = []
+            for a, b in segs[1:]:
+                ends = []
+                for i in range(len(open)):
+                    if a == open[i][0]:
+                        ends.append((i, 0, b))
+                    elif a == open[i][-1]:
+                        ends.append((i, 1, b))
+                    if b == open[i][0]:
+                        ends.append((i, 0, a))
+                    elif b == open[i][-1]:
+                        ends.append((i, 1, a))
+                if len(ends) == 0:
+                    open.append([a, b])
+                elif len(ends) == 1:
+                    i, end, pt = ends[0]
+                    if end == 0:
+                        open[i].insert(0, pt)
+                    else:
+                        open[i].append(pt)
+                elif len(ends) > 2:
+                    continue
+                elif ends[0][0] == ends[1][0]:
+                    l0 = open.pop(ends[0][0])
+                    closed.append(l0 + [l0[0]])
+                else:
+                    (i0, end0, pt0), (i1, end1, pt1) = ends
+                    l0, l1 = open[i0], open[i1]
+                    open = [l for i, l in enumerate(open) if i not in (i0, i1)]
+                    if end0 == 0:
+                        l0 = l0[::-1]
+                    if end1 == 1:
+                        l1 = l1[::-1]
+                    open.append(l0 + l1)
+            return sorted([(l[0] == l[-1], len(l)) for l in open + closed])
+
+        # on a dyadic grid where every crossing is an exact binary fraction
+        # neighbouring cells agree to the last bit, so matching the line
+        # ends on their grid position must join them as matching their
+        # coordinates did: spikes close, ridges from the edge stay open
+        x = numpy.linspace(-1, 1, 33)
+        y = numpy.linspace(-1, 1, 17)
+        spikes = -numpy.ones((33, 17))
+        spikes[2:-1:3, 2:-1:3] = 3.
+        spikes[0:8, 5] = 3.
+        edges = -numpy.ones((33, 17))
+        edges[1::4, 1::4] = 3.
+        edges[3, :] = 3.
+        closed = set()
+        for z in spikes, edges:
+            lines, nbad = _biggles.contour_lines(x, y, z, 0.)
+            self.assertEqual(nbad, 0)
+            new = sorted([((lx[0], ly[0]) == (lx[-1], ly[-1]), len(lx))
+                          for lx, ly in lines])
+            self.assertEqual(new, old_lines(x, y, z, 0.))
+            closed.update([c for c, n in new])
+        self.assertEqual(closed, set([False, True]))
+
+    def test_contours_resample(self):
+        x = numpy.linspace(-1, 1, 1601)
+        y = numpy.linspace(-1, 1, 1201)
+        z = x[:, numpy.newaxis] ** 2 + y[numpy.newaxis, :] ** 2
+
+        npoints = []
+        for resample in False, True:
+            c = biggles.Contours(z, x, y, resample=resample)
+            p = biggles.FramedPlot()
+            p.add(c)
+            _write_example('contours_resample', p)
+            npoints.append(sum([len(lx) for level in c.device_objects
+                                for lx, ly in level._lines]))
+        self.assertTrue(npoints[1] < npoints[0] / 2)
+
+    def test_sky_density(self):
+        from biggles.contour import _biggles
+
+        numpy.random.seed(2)
+        l = numpy.random.uniform(-numpy.pi, numpy.pi, 10000)
+        b = numpy.arcsin(numpy.random.uniform(-1, 1, 10000))
+
+        d = biggles.SkyDensity(l, b, nl=36, nb=18, chunksize=1000)
+        self.assertEqual(d.counts.sum(), 10000)
+        d.add_points(l[:10], b[:10])
+        self.assertEqual(d.counts.sum(), 10010)
+        self.assertRaises(ValueError, d.add_points, l[:10], b[:9])
+        self.assertRaises(ValueError, _biggles.sky_bin,
+                          l[:10], b[:9], d.counts)
+        self.assertEqual(d.counts.sum(), 10010)
+
+        # each cell of the raster shows the bin its centre came from
+        nl, nb = 36, 18
+        counts = numpy.arange(nl * nb, dtype=float).reshape(nl, nb)
+        nx, ny = 1000, 500
+        raster = _biggles.hammer_sky_raster(counts, nx, ny, 1., 0.5, 0.)
+        self.assertEqual(raster.shape, (nx, ny))
+        for i, j in (0, 0), (0, ny - 1), (nx - 1, 0), (nx - 1, ny - 1):
+            self.assertTrue(numpy.isnan(raster[i, j]))
+        self.assertFalse(numpy.isnan(raster[nx // 2, ny // 2]))
+
+        il, ib = numpy.mgrid[0:nl, 0:nb]
+        l = -numpy.pi + (il.ravel() + 0.5) * 2 * numpy.pi / nl
+        b = numpy.arcsin(-1. + (ib.ravel() + 0.5) * 2. / nb)
+        u, v = _biggles.hammer_call_vec(l, b, 1., 0.5, 0.)
+        inside = u ** 2 + 4 * v ** 2 < 0.9
+        self.assertTrue(inside.sum() > nl * nb // 2)
+        i = numpy.floor((u + 1.) / 2. * nx).astype(int)
+        j = numpy.floor((v + 0.5) * ny).astype(int)
+        self.assertTrue(numpy.array_equal(raster[i, j][inside],
+                                          counts.ravel()[inside]))
+
+        p = biggles.HammerAitoffPlot(l0=1., b0=0.5)
+        p.add(d)
+        _write_example('sky_density', p)
+
+    def test_hammer_geodesic(self):
+        from biggles.geometry import BoundingBox
+        from biggles.hammer import _HammerAitoffGeometry
+
+        geom = _HammerAitoffGeometry(BoundingBox((0, 0), (600, 300)),
+                                     0.3, 0.2)
+
+        # a dense track gets no extra points, a sparse one gets enough
+        l = numpy.linspace(-1, 1, 2000)
+        b = 0.3 * numpy.sin(5 * l)
+        self.assertEqual(sum([len(s[0]) for s in geom.geodesic(l, b)]), 2000)
+
+        l = numpy.linspace(-3, 3, 7)
+        b = 0.6 * numpy.sin(l)
+        segs = geom.geodesic(l, b)
+        self.assertEqual(len(segs), 2)
+        self.assertTrue(sum([len(s[0]) for s in segs]) > 7)
+
+        _biggles = sys.modules['biggles.hammer']._biggles
+        self.assertRaises(ValueError, geom.geodesic, l, b[:6])
+        self.assertRaises(ValueError, _biggles.hammer_geodesic_adaptive,
+                          l, b[:6], 0.3, 0.2, 0., 0.01)
+        self.assertRaises(ValueError, _biggles.hammer_geodesic_fill,
+                          l[:6], b, 4)
+        self.assertRaises(ValueError, _biggles.hammer_breaks,
+                          l, b[:6], 0.3, 0.2, 0.)
+
+        p = biggles.HammerAitoffPlot(l0=0.3, b0=0.2)
+        p.add(biggles.Curve(l, b))
+        _write_example('hammer_geodesic', p)
+
+    def test_hammer_memo(self):
+        from biggles.geometry import BoundingBox
+        hammer = sys.modules['biggles.hammer']
+        _biggles = hammer._biggles
+        calls = []
+
+        class Counting(object):
+
+            def __getattr__(self, name):
+                return getattr(_biggles, name)
+
+            def hammer_call_vec(self, l, b, *args):
+                calls.append(l)
+                return _biggles.hammer_call_vec(l, b, *args)
+
+        l = numpy.linspace(-3, 3, 50)
+        b = 0.6 * numpy.sin(l)
+        p = biggles.HammerAitoffPlot(l0=0.3, b0=0.2)
+        points = biggles.Points(l, b)
+        p.add(biggles.Curve(l, b), points)
+        fname = "examplehammer_memo.eps"
+
+        hammer._biggles = Counting()
+        try:
+            # the graticule is projected once per view
+            paths = hammer._graticule(p.l0, p.b0, p.rot, p.ribs_l, p.ribs_b)
+            del calls[:]
+            self.assertTrue(hammer._graticule(p.l0, p.b0, p.rot,
+                                              p.ribs_l, p.ribs_b) is paths)
+            self.assertEqual(calls, [])
+
+            # and so is each content array, across all the layout passes
+            p.write_eps(fname)
+        finally:
+            hammer._biggles = _biggles
+        try:
+            os.remove(fname)
+        except:
+            pass
+
+        geom = hammer._HammerAitoffGeometry(BoundingBox((0, 0), (600, 300)),
+                                            p.l0, p.b0, p.rot)
+        self.assertEqual(len(calls), len(geom.geodesic(l, b)) + 1)
+        self.assertEqual(len(set(map(id, calls))), len(calls))
+        self.assertEqual(len([c for c in calls if c is points.x]), 1)
+
+    def test_threads(self):
+        from biggles.config import value
+        from biggles.contour import _biggles, _join_levels
+
+        x = numpy.linspace(-1, 1, 41)
+        y = numpy.linspace(-1, 1, 31)
+        z = x[:, numpy.newaxis] ** 2 + y[numpy.newaxis, :] ** 2
+        levels = [0.1, 0.25, 0.5, 1., 1.5]
+
+        whole = _biggles.contour_levels(x, y, z, levels)
+        parts = [_biggles.contour_levels(x, y, z, levels[:2]),
+                 _biggles.contour_levels(x, y, z, levels[2:])]
+        for a, b in zip(whole, _join_levels(parts)):
+            self.assertTrue(numpy.array_equal(a, b))
+
+        threads = value('default', 'threads')
+        try:
+            biggles.configure('threads', 4)
+            p = biggles.HammerAitoffPlot()
+            l = numpy.linspace(-3, 3, 200000)
+            p.add(biggles.Curve(l, 0.5 * numpy.sin(3 * l)))
+            _write_example('threads', p)
+        finally:
+            biggles.configure('threads', threads)
+
+    def test_float32_views(self):
+        from biggles.contour import _biggles
+
+        table = numpy.random.normal(size=(200, 4)).astype(numpy.float32)
+        x = numpy.linspace(-1, 1, 21)
+        y = numpy.linspace(-1, 1, 21)
+        z = numpy.hypot(x[:, numpy.newaxis], y[numpy.newaxis, :])
+        z = z.astype(numpy.float32)
+
+        # float32 and strided arrays are read in place
+        a = _biggles.contour_levels(x, y[::2], z[:, ::2], [0.5])
+        b = _biggles.contour_levels(x, y[::2].copy(),
+                                    numpy.array(z[:, ::2], float), [0.5])
+        for u, v in zip(a, b):
+            self.assertTrue(numpy.array_equal(u, v))
+
+        p = biggles.FramedPlot()
+        p.add(biggles.Points(table[:, 1], table[:, 3]))
+        p.add(biggles.Contours(z[:, ::2], x, y[::2]))
+        _write_example('float32_views', p)
+
+    def test_layout(self):
+        from biggles.geometry import \
+            BoundingBox, pt_add, pt_sub, pt_mul, pt_len
+
+        def old_interior(plot, device, exterior):
+            # the fixed point iteration the closed form replaced
+            interior = exterior.copy()
+            for i in range(50):
+                bb = plot.exterior(device, interior)
+                dll = pt_sub(exterior.lowerleft(), bb.lowerleft())
+                dur = pt_sub(exterior.upperright(), bb.upperright())
+                if max(pt_len(dll), pt_len(dur)) < 1e-4 * exterior.diagonal():
+                    break
+                scale = interior.diagonal() / bb.diagonal()
+                interior = BoundingBox(
+                    pt_add(interior.lowerleft(), pt_mul(scale, dll)),
+                    pt_add(interior.upperright(), pt_mul(scale, dur)))
+            if plot.aspect_ratio is not None:
+                interior.make_aspect_ratio(plot.aspect_ratio)
+            return interior
+
+        calls = []
+        layouts = []
+
+        class Plot(biggles.FramedPlot):
+
+            def exterior(self, device, interior):
+                calls[-1] += 1
+                return biggles.FramedPlot.exterior(self, device, interior)
+
+            def interior(self, device, exterior):
+                calls.append(0)
+                interior = biggles.FramedPlot.interior(self, device, exterior)
+                layouts.append((interior, calls[-1],
+                                old_interior(self, device, exterior)))
+                return interior
+
+        p = Plot()
+        p.title = "layout"
+        p.xlabel = r"$\alpha$ label"
+        p.ylabel = "y label"
+        p.y2.draw_ticklabels = 1
+        p.add(biggles.Curve([0, 1e4], [-1e-3, 1e-3]))
+        _write_example('layout', p)
+
+        self.assertTrue(len(layouts) > 0)
+        for interior, n, old in layouts:
+            self.assertTrue(n in (1, 2), n)
+            tol = 0.005 * old.diagonal()
+            self.assertTrue(pt_len(pt_sub(interior.p0, old.p0)) < tol)
+            self.assertTrue(pt_len(pt_sub(interior.p1, old.p1)) < tol)
+
+    def test_ticks(self):
+        import math
+        mod = sys.modules['biggles.biggles']
+
+        # the loops the numpy versions replaced
+        def old_ticklist_linear(lo, hi, sep, origin=0.):
+            r = []
+            a = mod._ceil(float(lo - origin) / float(sep))
+            b = mod._floor(float(hi - origin) / float(sep))
+            r0 = origin + a * sep
+            for i in range(b - a + 1):
+                r.append(r0 + i * sep)
+            return r
+
+        def old_ticks_num_linear(lim, num):
+            ticks = []
+            a = lim[0]
+            b = (lim[1] - lim[0]) / float(num - 1)
+            for i in range(num):
+                ticks.append(a + i * b)
+            return ticks
+
+        def old_ticks_num_log(lim, num):
+            ticks = []
+            a = math.log10(lim[0])
+            b = (math.log10(lim[1]) - a) / float(num - 1)
+            for i in range(num):
+                ticks.append(a + i * b)
+            return map(mod._pow10, ticks)
+
+        def old_subticks_log(lim, ticks, num=None):
+            nlo = mod._ceil(math.log10(lim[0]))
+            nhi = mod._floor(math.log10(lim[1]))
+            nn = nhi - nlo + 1
+            if nn >= 10:
+                return map(mod._pow10, mod._subticks_linear(
+                    (mod._log10(lim[0]), mod._log10(lim[1])),
+                    map(mod._log10, ticks), num))
+            elif nn >= 2:
+                minor_ticks = []
+                for i in range(nlo - 1, nhi + 1):
+                    for j in range(1, 10):
+                        z = j * mod._pow10(i)
+                        if lim[0] <= z and z <= lim[1]:
+                            minor_ticks.append(z)
+                return minor_ticks
+            else:
+                return mod._subticks_linear(lim, ticks, num)
+
+        old = {
+            '_ticklist_linear': old_ticklist_linear,
+            '_ticks_num_linear': old_ticks_num_linear,
+            '_ticks_num_log': old_ticks_num_log,
+            '_subticks_log': old_subticks_log,
+        }
+
+        def all_ticks():
+            out = []
+            for lim in lims:
+                ticks = mod._ticks_default_linear(lim)
+                out.append(ticks)
+                if len(ticks) > 1:
+                    for num in None, 1, 3:
+                        out.append(mod._subticks_linear(lim, ticks, num))
+                out.append(mod._ticks_num_linear(lim, 7))
+            for lim in loglims:
+                ticks = mod._ticks_default_log(lim)
+                out.append(ticks)
+                if len(ticks) > 1:
+                    out.append(mod._subticks_log(lim, ticks))
+                out.append(mod._ticks_num_log(lim, 7))
+            return out
+
+        rs = numpy.random.RandomState(5)
+        lims = []
+        loglims = []
+        for i in range(2000):
+            lo = rs.uniform(-1e3, 1e3) * 10. ** rs.randint(-8, 9)
+            lims.append((lo, lo + rs.uniform(1e-3, 1e3) *
+                         10. ** rs.randint(-8, 9)))
+            lo = 10. ** rs.uniform(-20, 20)
+            loglims.append((lo, lo * 10. ** rs.uniform(0.01, 25)))
+
+        saved = dict([(name, getattr(mod, name)) for name in old])
+        try:
+            for name, func in old.items():
+                setattr(mod, name, func)
+            expected = all_ticks()
+        finally:
+            for name, func in saved.items():
+                setattr(mod, name, func)
+        self.assertEqual(all_ticks(), expected)
+
+        # the memo hands back the first result for an equal key
+        mod._tick_cache.clear()
+        p = biggles.FramedPlot()
+        p.x1.log = 1
+        p.y1.ticks = 5
+        p.add(biggles.Curve([1e-3, 1e4], [-2.5, 7.]))
+        _write_example('ticks', p)
+        self.assertTrue(len(mod._tick_cache) > 0)
+        for key, value in mod._tick_cache.items():
+            if key[0] == 'ticklabels':
+                self.assertEqual(value, mod._format_ticklabels(list(key[1])))
+            elif key[0] == 'subticks':
+                args = (key[2], list(key[3])) + key[4:]
+                self.assertEqual(value, key[1](*args))
+            else:
+                self.assertEqual(value, key[1](*key[2:]))
+        key = ('ticks', mod._ticks_default_linear, (0., 1.))
+        ticks = mod._tick_memo(key, mod._ticks_default_linear, (0., 1.))
+        self.assertTrue(mod._tick_memo(key, None) is ticks)
+
+    def test_renderer_state(self):
+        from biggles.libplot import renderer
+
+        # random nesting against a stack of full copies
+        numpy.random.seed(3)
+        state = renderer.RendererState()
+        stack = [{}]
+        for i in range(2000):
+            op = numpy.random.randint(4)
+            if op == 0 and len(stack) > 1:
+                state.restore()
+                stack.pop()
+            elif op == 1:
+                state.save()
+                stack.append(dict(stack[-1]))
+            else:
+                key = "abcd"[numpy.random.randint(4)]
+                state.set(key, i)
+                stack[-1][key] = i
+            self.assertEqual(state.current, stack[-1])
+
+        # what libplot has, as seen through the calls the renderer makes
+        pl = [{}]
+
+        class Renderer(renderer.ImageRenderer):
+
+            def gsave(self):
+                pl.append(dict(pl[-1]))
+                renderer.ImageRenderer.gsave(self)
+
+            def grestore(self):
+                pl.pop()
+                renderer.ImageRenderer.grestore(self)
+
+            def set_color_fg(self, r, g, b):
+                for key in "color", "linecolor", "fillcolor":
+                    pl[-1][key] = r, g, b
+                renderer.ImageRenderer.set_color_fg(self, r, g, b)
+
+            def set_color_pen(self, r, g, b):
+                pl[-1]["linecolor"] = r, g, b
+                renderer.ImageRenderer.set_color_pen(self, r, g, b)
+
+            def set_color_fill(self, r, g, b):
+                pl[-1]["fillcolor"] = r, g, b
+                renderer.ImageRenderer.set_color_fill(self, r, g, b)
+
+            def colored_symbols(self, x, y, c):
+                renderer.ImageRenderer.colored_symbols(self, x, y, c)
+                for key in "color", "linecolor", "fillcolor":
+                    pl[-1][key] = None
+
+            def density_plot(self, densgrid, extent):
+                renderer.ImageRenderer.density_plot(self, densgrid, extent)
+                for key in "color", "linecolor", "fillcolor":
+                    pl[-1][key] = None
+
+        def set(key, value):
+            r.set(key, value)
+            self.assertEqual(pl[-1][key], renderer._hexcolor(value))
+
+        fname = "examplerenderer_state.png"
+        r = Renderer("png", 100, 100, fname)
+        r.open()
+        x = numpy.linspace(10, 90, 5)
+        c = numpy.random.uniform(size=(5, 3))
+        grid = numpy.random.uniform(size=(4, 4))
+
+        set("color", 0xff0000)
+        outer = dict(r.state.current)
+        r.save_state()
+        set("linecolor", 0x00ff00)
+        middle = dict(r.state.current)
+        r.save_state()
+        r.colored_symbols(x, x, c)
+        r.save_state()
+        set("color", 0xff0000)
+        r.density_plot(grid, ((0, 0), (100, 100)))
+        r.restore_state()
+        set("fillcolor", 0x0000ff)
+        r.colored_symbols(x, x, c)
+        r.restore_state()
+        self.assertEqual(r.state.current, middle)
+        set("linecolor", 0x00ff00)
+        set("fillcolor", 0xff0000)
+        r.restore_state()
+        self.assertEqual(r.state.current, outer)
+        set("color", 0xff0000)
+        set("linecolor", 0xff0000)
+        self.assertEqual((len(pl), r.pl_saved), (1, []))
+        r.close()
+        try:
+            os.remove(fname)
+        except:
+            pass
+
+    def test_text_cache(self):
+        from biggles.libplot import renderer
+
+        p = biggles.FramedPlot()
+        p.title = r"text cache $\alpha^2$"
+        p.add(biggles.Curve([0, 1, 2], [0, 1, 0]))
+
+        renderer.clear_text_cache()
+        _write_example('text_cache', p)
+        info = renderer.text_cache_info()
+        self.assertTrue(info['textwidth']['hits'] > 0)
+        self.assertTrue(info['tex2libplot']['hits'] > 0)
+
+    def test_text_cache_threads(self):
+        import threading
+        from biggles.libplot.renderer import _LRUCache
+
+        cache = _LRUCache(8)
+        errors = []
+
+        def run(seed):
+            rs = numpy.random.RandomState(seed)
+            try:
+                for key in rs.randint(0, 32, size=20000):
+                    if cache.get(key) is None:
+                        cache.put(key, key)
+            except Exception as e:
+                errors.append(e)
+
+        if hasattr(sys, 'setswitchinterval'):
+            interval = sys.getswitchinterval()
+            sys.setswitchinterval(1e-6)
+        else:
+            interval = sys.getcheckinterval()
+            sys.setcheckinterval(1)
+        try:
+            threads = [threading.Thread(target=run, args=(i,))
+                       for i in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            if hasattr(sys, 'setswitchinterval'):
+                sys.setswitchinterval(interval)
+            else:
+                sys.setcheckinterval(interval)
+
+        self.assertEqual(errors, [])
+        info = cache.info()
+        self.assertEqual(info['hits'] + info['misses'], 8 * 20000)
+        self.assertTrue(info['size'] <= 8)
+
+        # the list still runs through every key once, both ways
+        keys = []
+        link = cache.root[1]
+        while link is not cache.root:
+            self.assertTrue(link[1][0] is link)
+            self.assertEqual(link[2], link[3])
+            keys.append(link[2])
+            link = link[1]
+        self.assertEqual(sorted(keys), sorted(cache.links.keys()))
+
+    def test_tex2libplot(self):
+        from biggles.libplot.tex2libplot import tex2libplot
+
+        self.assertEqual(tex2libplot(r'$a_bc'), r'a\sbb\ebc')
+        self.assertEqual(tex2libplot(r'$x^2_i$'), r'x\mk\sp2\ep\rt\sbi\eb')
+        self.assertEqual(tex2libplot(r'{\it \alpha} $\alpha$ \$'),
+                         r'\f2\alpha\f1 \*a $')
+
+    def test_hershey_metrics(self):
+        from biggles.libplot.hershey import string_width
+
+        self.assertEqual(string_width('A', 33.), 20.)
+        self.assertEqual(string_width('AA', 3.3), 4.)
+        self.assertAlmostEqual(string_width(r'x\sp2\ep', 33.), 20 + 0.6 * 20)
+        self.assertAlmostEqual(string_width(r'x\mk\sp2\ep\rt\sbi\eb', 33.),
+                               20 + 0.6 * 11)
+        self.assertEqual(string_width(r'\f2A\f1A\*a', 33.), 63.)
+        self.assertTrue(string_width(r'\pd', 33.) is None)
+        self.assertTrue(string_width('A', 33., 'Times-Roman') is None)
+
+    def test_hershey_device_widths(self):
+        from biggles.libplot import renderer
+        from biggles.libplot.tex2libplot import tex2libplot
+
+        labels = ["Axis label 0123456789", r"$\alpha^2_i + \beta$",
+                  r"{\it italic} {\bf bold} x_{max}", "%&()[]{}<>/|~"]
+        faces = ("HersheySerif", "HersheySerif-Italic",
+                 "HersheySerif-Bold", "HersheySerif-BoldItalic")
+
+        class Skewed(renderer.ImageRenderer):
+
+            def get_string_width(self, s):
+                w = renderer.ImageRenderer.get_string_width(self, s)
+                return 1.25 * w + 1.
+
+        # whether the tables are used or not, widths are the device's
+        fname = "examplehershey_device_widths.png"
+        for cls in renderer.ImageRenderer, Skewed:
+            renderer.clear_text_cache()
+            r = cls("png", 400, 400, fname)
+            r.open()
+            r.set("fontsize", 12.)
+            for face in faces:
+                r.set("fontface", face)
+                for label in labels:
+                    width = r.get_string_width(tex2libplot(label))
+                    self.assertTrue(abs(r.textwidth(label) - width) < 1e-2,
+                                    (cls, face, label))
+            r.close()
+        self.assertFalse(r._hershey_ok(faces[0], 12.))
+        renderer.clear_text_cache()
+        try:
+            os.remove(fname)
+        except:
+            pass
+
     def test_labels(self): 
         import numpy
         from numpy import linspace
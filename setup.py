@@ -173,9 +173,11 @@ setup(
     ext_modules=[
         Extension("_biggles",
                   ["biggles/_biggles.c"],
+                  depends=["biggles/_bgl_array.h"],
                   include_dirs=_biggles_module_inc_dirs),
         Extension("libplot._libplot_pywrap",
                   ["biggles/libplot/_libplot_pywrap.c"],
+                  depends=["biggles/_bgl_array.h"],
                   include_dirs=libplot_module_inc_dirs,
                   library_dirs=libplot_module_lib_dirs,
                   libraries=libplot_module_libs),